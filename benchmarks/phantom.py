@@ -0,0 +1,112 @@
+import argparse
+import json
+import os
+import nibabel as nib
+import numpy as np
+
+# GT file names from the bottom disc up, matching the dice_score label mappings
+GT_NAMES = ["BS_L4_5", "BS_L3_4", "BS_L2_3", "BS_L1_2"]
+
+def gt_name(k):
+    """GT file name (without extension) of the k-th disc from the bottom."""
+    return GT_NAMES[k] if k < len(GT_NAMES) else f"BS_disc_{k + 1}"
+
+def make_spine_phantom(shape=(256, 256, 128), n_discs=5, gap=4, disc_radius=None, disc_thickness=None,
+                       n_noise=10, noise_radius=1, seed=0):
+    """
+    Build a synthetic spine label volume of the given (x, y, z) shape.
+    Discs are ellipsoids stacked along z, centered in x/y, separated by gap
+    voxels, labelled 1..n_discs from the bottom (lowest z) up. n_noise small
+    speckle components (label n_discs + 1) are scattered outside the column.
+    Returns the label array in NIfTI (x, y, z) order.
+    """
+    rng = np.random.default_rng(seed)
+    nx, ny, nz = shape
+    if disc_thickness is None:
+        disc_thickness = max(2, (nz - gap * (n_discs + 1)) // n_discs)
+    if disc_radius is None:
+        disc_radius = max(2, min(nx, ny) // 10)
+    column_height = n_discs * disc_thickness + (n_discs - 1) * gap
+    if column_height > nz:
+        raise ValueError(f"{n_discs} discs of thickness {disc_thickness} with gap {gap} do not fit in {nz} slices.")
+
+    labels = np.zeros(shape, dtype=np.uint8)
+    cx, cy = nx / 2, ny / 2
+    z0 = (nz - column_height) // 2
+
+    # Each disc is built inside its own box, so generation cost scales with the disc size
+    for k in range(n_discs):
+        zs = z0 + k * (disc_thickness + gap)
+        x_lo, x_hi = int(cx - disc_radius), int(np.ceil(cx + disc_radius)) + 1
+        y_lo, y_hi = int(cy - disc_radius * 0.7), int(np.ceil(cy + disc_radius * 0.7)) + 1
+        x, y, z = np.ogrid[x_lo:x_hi, y_lo:y_hi, zs:zs + disc_thickness]
+        inside = (((x - cx) / disc_radius) ** 2 + ((y - cy) / (disc_radius * 0.7)) ** 2
+                  + ((z - zs - (disc_thickness - 1) / 2) / (disc_thickness / 2)) ** 2) <= 1
+        labels[x_lo:x_hi, y_lo:y_hi, zs:zs + disc_thickness][inside] = k + 1
+
+    # Speckle noise away from the disc column
+    noise_label = n_discs + 1
+    for _ in range(n_noise):
+        while True:
+            p = rng.integers([noise_radius] * 3, np.array(shape) - noise_radius)
+            if abs(p[0] - cx) > 2 * disc_radius or abs(p[1] - cy) > 2 * disc_radius:
+                break
+        r = noise_radius
+        labels[p[0] - r:p[0] + r + 1, p[1] - r:p[1] + r + 1, p[2] - r:p[2] + r + 1] = noise_label
+
+    return labels
+
+def write_phantom(out_dir, shape=(256, 256, 128), n_discs=5, spacing=(1.0, 1.0, 1.0), seed=0, **kwargs):
+    """
+    Write a phantom case to out_dir:
+    - image.nii.gz:   intensity image (discs bright on a noisy background)
+    - discs.nii.gz:   binary disc mask with speckles, like TotalSegmentator's output
+    - labeled.nii.gz: discs labelled 1..n from the bottom, speckles removed
+    - gt/<name>.nii.gz: one binary GT file per disc
+    - label_mapping.json: GT name -> label in labeled.nii.gz
+    Returns a dict of the written paths.
+    """
+    labels = make_spine_phantom(shape, n_discs, seed=seed, **kwargs)
+    affine = np.diag(list(spacing) + [1.0])
+    gt_dir = os.path.join(out_dir, "gt")
+    os.makedirs(gt_dir, exist_ok=True)
+
+    discs = (labels > 0).astype(np.uint8)
+    labeled = np.where(labels <= n_discs, labels, 0).astype(np.uint8)
+    rng = np.random.default_rng(seed)
+    image = (rng.normal(100, 10, shape) + 400.0 * discs).astype(np.int16)
+
+    paths = {
+        "image": os.path.join(out_dir, "image.nii.gz"),
+        "discs": os.path.join(out_dir, "discs.nii.gz"),
+        "labeled": os.path.join(out_dir, "labeled.nii.gz"),
+        "gt_folder": gt_dir,
+        "label_mapping": os.path.join(out_dir, "label_mapping.json"),
+    }
+    nib.save(nib.Nifti1Image(image, affine), paths["image"])
+    nib.save(nib.Nifti1Image(discs, affine), paths["discs"])
+    nib.save(nib.Nifti1Image(labeled, affine), paths["labeled"])
+
+    mapping = {}
+    for k in range(n_discs):
+        name = gt_name(k)
+        mapping[name] = k + 1
+        nib.save(nib.Nifti1Image((labels == k + 1).astype(np.uint8), affine), os.path.join(gt_dir, name + ".nii.gz"))
+    with open(paths["label_mapping"], 'w') as f:
+        json.dump(mapping, f, indent=2)
+    return paths
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic spine phantom (NIfTI label volumes and per-disc GT).")
+    parser.add_argument("--output_dir", type=str, required=True, help="Folder to write the phantom into")
+    parser.add_argument("--shape", type=int, nargs=3, default=[256, 256, 128], help="Volume size x y z")
+    parser.add_argument("--n_discs", type=int, default=5, help="Number of discs")
+    parser.add_argument("--gap", type=int, default=4, help="Gap between discs in voxels")
+    parser.add_argument("--n_noise", type=int, default=10, help="Number of speckle components")
+    parser.add_argument("--spacing", type=float, nargs=3, default=[1.0, 1.0, 1.0], help="Voxel spacing x y z (mm)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    paths = write_phantom(args.output_dir, tuple(args.shape), args.n_discs, tuple(args.spacing), args.seed,
+                          gap=args.gap, n_noise=args.n_noise)
+    print(f"Wrote phantom to {args.output_dir}")
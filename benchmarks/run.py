@@ -0,0 +1,153 @@
+import argparse
+import contextlib
+import importlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing as mp
+
+from spine_eval.main.instrument import peak_rss_bytes
+
+# Volume sizes (x, y, z) benchmarked by default
+DEFAULT_SIZES = ["128x128x64", "256x256x128", "512x512x256"]
+
+# Each stage is (modules, prepare, run). Every run is in a fresh process: the
+# modules are imported and prepare(paths, work_dir) is called before the timer
+# starts, so cold imports (SimpleITK, nibabel, ...) are not counted as stage
+# time. prepare's return value is passed to run(paths, work_dir, prepared)
+
+def _run_separate(paths, work_dir, prepared):
+    from spine_eval.utils.separate_if_sacrum import separate
+    separate(paths["discs"], os.path.join(work_dir, "labeled_discs.nii.gz"), os.path.join(work_dir, "labels.txt"))
+
+def _run_dice(paths, work_dir, mapping):
+    from spine_eval.dice_score.engine import compute_dice_per_label
+    compute_dice_per_label(paths["gt_folder"], paths["labeled"], mapping, os.path.join(work_dir, "dice.csv"))
+
+def _prepare_dice(paths, work_dir):
+    with open(paths["label_mapping"]) as f:
+        return json.load(f)
+
+def _prepare_gzip_check(paths, work_dir):
+    # An uncompressed NIfTI saved under a .nii.gz name, so the repair path runs
+    import gzip
+    target = os.path.join(work_dir, "broken.nii.gz")
+    with gzip.open(paths["image"], 'rb') as f_in, open(target, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    return target
+
+def _run_gzip_check(paths, work_dir, target):
+    from spine_eval.utils.gzip_check import check_and_fix_gzip
+    check_and_fix_gzip(target, full=True)
+
+STAGES = {
+    "separate": (["spine_eval.utils.separate_if_sacrum"], None, _run_separate),
+    "dice": (["spine_eval.dice_score.engine"], _prepare_dice, _run_dice),
+    "gzip_check": (["spine_eval.utils.gzip_check"], _prepare_gzip_check, _run_gzip_check),
+}
+
+def _measure(stage, paths, work_dir):
+    """Run one stage in a fresh process and return (wall seconds, peak RSS bytes)."""
+    os.makedirs(work_dir, exist_ok=True)
+    modules, prepare, run = STAGES[stage]
+    for name in modules:
+        importlib.import_module(name)
+    prepared = prepare(paths, work_dir) if prepare else None
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+        start = time.perf_counter()
+        run(paths, work_dir, prepared)
+        wall = time.perf_counter() - start
+    return wall, peak_rss_bytes()
+
+def parse_size(text):
+    return tuple(int(v) for v in text.lower().split("x"))
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def run_benchmarks(sizes=DEFAULT_SIZES, stages=list(STAGES), repeat=3, n_discs=5, n_noise=20, tmp_dir=None):
+    """
+    Benchmark each stage on a phantom of every size. Each run happens in a
+    fresh spawned process so that peak RSS is per stage. The best wall time
+    of `repeat` runs is reported.
+    """
+    from benchmarks.phantom import write_phantom
+
+    results = []
+    ctx = mp.get_context("spawn")
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as root:
+        for size_text in sizes:
+            size = parse_size(size_text)
+            voxels = size[0] * size[1] * size[2]
+            case_dir = os.path.join(root, size_text)
+            paths = write_phantom(case_dir, size, n_discs, n_noise=n_noise)
+
+            for stage in stages:
+                walls, rss = [], []
+                for r in range(repeat):
+                    with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                        wall, peak = pool.submit(_measure, stage, paths, os.path.join(case_dir, f"{stage}_{r}")).result()
+                    walls.append(wall)
+                    rss.append(peak)
+                best = min(walls)
+                result = {
+                    "stage": stage,
+                    "size": size_text,
+                    "voxels": voxels,
+                    "wall_s": best,
+                    "wall_s_all": walls,
+                    "peak_rss_mb": max(rss) / 2 ** 20,
+                    "voxels_per_s": voxels / best if best > 0 else None,
+                }
+                results.append(result)
+                print(f"{stage:12s} {size_text:>14s}  {best:8.3f} s  {result['peak_rss_mb']:8.1f} MB  "
+                      f"{result['voxels_per_s'] / 1e6:9.1f} Mvox/s")
+
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+
+def compare(old_report, new_report):
+    """Print the speedup and memory change of each (stage, size) between two reports."""
+    old = {(r["stage"], r["size"]): r for r in old_report["results"]}
+    print(f"Comparing {old_report.get('git_commit')} -> {new_report.get('git_commit')}")
+    for r in new_report["results"]:
+        o = old.get((r["stage"], r["size"]))
+        if o is None:
+            continue
+        print(f"{r['stage']:12s} {r['size']:>14s}  speedup {o['wall_s'] / r['wall_s']:6.2f}x  "
+              f"peak RSS {o['peak_rss_mb']:8.1f} -> {r['peak_rss_mb']:8.1f} MB")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark pipeline stages on synthetic spine phantoms.")
+    parser.add_argument("--sizes", type=str, nargs="+", default=DEFAULT_SIZES, help="Volume sizes as XxYxZ")
+    parser.add_argument("--stages", type=str, nargs="+", default=list(STAGES), choices=list(STAGES))
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per stage and size (best is reported)")
+    parser.add_argument("--n_noise", type=int, default=20, help="Speckle components per phantom")
+    parser.add_argument("--output", type=str, default="benchmark_results.json", help="JSON file to save results to")
+    parser.add_argument("--compare", type=str, default=None, help="Previous results JSON to compare against")
+    parser.add_argument("--tmp_dir", type=str, default=None, help="Where phantoms are generated")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.sizes, args.stages, args.repeat, n_noise=args.n_noise, tmp_dir=args.tmp_dir)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved results to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
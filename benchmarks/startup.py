@@ -0,0 +1,71 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.run import git_commit
+
+# (name, command line) pairs timed by default, run from the repo root.
+# The legacy entries call the scripts directly, as before the unified CLI.
+DEFAULT_COMMANDS = {
+    "cli --help": [sys.executable, "-m", "spine_eval.main.cli", "--help"],
+    "cli pipeline --help": [sys.executable, "-m", "spine_eval.main.cli", "pipeline", "--help"],
+    "cli gzip-check --help": [sys.executable, "-m", "spine_eval.main.cli", "gzip-check", "--help"],
+    "cli results --help": [sys.executable, "-m", "spine_eval.main.cli", "results", "--help"],
+    "cli dice-ts --help": [sys.executable, "-m", "spine_eval.main.cli", "dice-ts", "--help"],
+    "TS_pipeline --help": [sys.executable, "-m", "spine_eval.main.TS_pipeline", "--help"],
+    "ds_ts --help": [sys.executable, "-m", "spine_eval.dice_score.ds_ts", "--help"],
+}
+
+# Libraries whose import dominates startup
+HEAVY_MODULES = ["SimpleITK", "nibabel", "numpy", "tqdm"]
+
+def time_command(cmd, repeat=5, cwd=None):
+    """Best and median wall time (s) of `repeat` runs of a command in a fresh interpreter."""
+    walls = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(cmd, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        walls.append(time.perf_counter() - start)
+    walls.sort()
+    return walls[0], walls[len(walls) // 2]
+
+def heavy_imports(cmd, cwd=None):
+    """Heavy libraries imported by a Python command line, from `python -X importtime`."""
+    err = subprocess.run([cmd[0], "-X", "importtime"] + cmd[1:], cwd=cwd, capture_output=True, text=True).stderr
+    imported = {line.rsplit("|", 1)[-1].strip() for line in err.splitlines() if line.startswith("import time:")}
+    return [m for m in HEAVY_MODULES if m in imported]
+
+def run_startup_benchmarks(commands=DEFAULT_COMMANDS, repeat=5):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    baseline = time_command([sys.executable, "-c", "pass"], repeat, root)[0]
+    print(f"{'interpreter only':28s} {baseline * 1e3:8.1f} ms")
+
+    results = []
+    for name, cmd in commands.items():
+        best, median = time_command(cmd, repeat, root)
+        heavy = heavy_imports(cmd, root)
+        results.append({"command": name, "argv": cmd[1:], "best_s": best, "median_s": median, "heavy_imports": heavy})
+        print(f"{name:28s} {best * 1e3:8.1f} ms  (median {median * 1e3:.1f} ms)  imports: {', '.join(heavy) or '-'}")
+
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": git_commit(),
+        "python": sys.version.split()[0],
+        "interpreter_s": baseline,
+        "results": results,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure command line startup time (fresh interpreter per run).")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per command (best and median are reported)")
+    parser.add_argument("--output", type=str, default=None, help="JSON file to save results to")
+    args = parser.parse_args()
+
+    report = run_startup_benchmarks(repeat=args.repeat)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved results to {args.output}")
@@ -0,0 +1,18 @@
+from spine_eval.dice_score.engine import compute_dice_per_label, build_parser, run_from_args
+# Re-exported for code that imported them from here before they moved to the engine
+from spine_eval.dice_score.engine import dice_score, extract_label  # noqa: F401
+
+# Define the mapping of labels to their corresponding values
+LABEL_MAPPING = {
+    "BS_L1_2": 4,
+    "BS_L2_3": 3,
+    "BS_L3_4": 2,
+    "BS_L4_5": 1
+    # Modify dictionary based on dataset
+}
+
+def cli(argv=None, prog=None):
+    run_from_args(build_parser(prog=prog).parse_args(argv), LABEL_MAPPING)
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,299 @@
+import os
+import csv
+import argparse
+import functools
+from concurrent.futures import ThreadPoolExecutor
+import nibabel as nib
+import numpy as np
+from tqdm import tqdm
+
+from spine_eval.dice_score import surface
+from spine_eval.dice_score.results_db import store_results
+from spine_eval.utils.prefetch import DEFAULT_DEPTH, prefetch, add_prefetch_arguments, prefetch_options
+from spine_eval.utils.roi import foreground_bbox
+from spine_eval.utils.volume import DEFAULT_SLAB_BYTES, crop_extent, grid_affine, load_label_volume, iter_slabs, slab_depth, volume_info
+
+# Number of voxels handed to np.bincount at once. bincount casts its input to
+# intp, so chunking keeps that temporary small regardless of the volume size.
+CHUNK_VOXELS = 1 << 22
+
+def dice_score(y_true, y_pred):
+    """
+    Compute the Dice score between two binary arrays.
+    Kept for compatibility: formerly part of ds_ts and ds_spineps.
+    """
+    intersection = np.count_nonzero((y_true > 0) & (y_pred > 0))
+    size_true = np.count_nonzero(y_true > 0)
+    size_pred = np.count_nonzero(y_pred > 0)
+    return dice_from_counts(intersection, size_true, size_pred)
+
+def dice_from_counts(intersection, size_true, size_pred):
+    """
+    Compute the Dice score from precomputed voxel counts.
+    """
+    if size_true + size_pred == 0:
+        return 1.0  # 1 if both are empty
+    return (2. * intersection) / (size_true + size_pred)
+
+def extract_label(mask, label_value):
+    """
+    Extract only the voxels corresponding to a specific label.
+    Kept for compatibility: formerly part of ds_ts and ds_spineps.
+    """
+    return (mask == label_value).astype(np.uint8)
+
+def label_counts(arr, n_labels=None):
+    """
+    Count voxels of every label value in a single chunked pass.
+    """
+    arr = np.ravel(arr, order='K')
+    if n_labels is None:
+        n_labels = int(arr.max(initial=0)) + 1
+    counts = np.zeros(n_labels, dtype=np.int64)
+    for start in range(0, arr.size, CHUNK_VOXELS):
+        counts += np.bincount(arr[start:start + CHUNK_VOXELS], minlength=n_labels)
+    return counts
+
+def confusion_histogram(gt, pred, n_gt=None, n_pred=None, binary_gt=False):
+    """
+    Count voxels for every (gt_label, pred_label) pair in a single pass.
+
+    Returns an array of shape (n_gt, n_pred) where entry [g, p] is the number of
+    voxels labelled g in gt and p in pred. With binary_gt, every non-zero GT
+    voxel is counted as label 1.
+    """
+    # nibabel arrays are Fortran-ordered: ravel both in the same order without copying when possible
+    order = 'F' if np.isfortran(gt) and np.isfortran(pred) else 'C'
+    gt = np.ravel(gt, order=order)
+    pred = np.ravel(pred, order=order)
+    if gt.shape != pred.shape:
+        raise ValueError(f"Shape mismatch between GT ({gt.size} voxels) and prediction ({pred.size} voxels).")
+
+    if binary_gt:
+        n_gt = 2
+    elif n_gt is None:
+        n_gt = int(gt.max(initial=0)) + 1
+    if n_pred is None:
+        n_pred = int(pred.max(initial=0)) + 1
+
+    n_bins = n_gt * n_pred
+    hist = np.zeros(n_bins, dtype=np.int64)
+    for start in range(0, gt.size, CHUNK_VOXELS):
+        g = gt[start:start + CHUNK_VOXELS]
+        g = (g > 0) if binary_gt else g
+        p = pred[start:start + CHUNK_VOXELS]
+        hist += np.bincount(g.astype(np.intp) * n_pred + p, minlength=n_bins)
+    return hist.reshape(n_gt, n_pred)
+
+def slab_dice_counts(gt_paths, label_values, pred_file, slab_bytes=DEFAULT_SLAB_BYTES):
+    """
+    Low-memory Dice counts: the prediction and every GT file are streamed
+    slab by slab along z in lockstep, with all slabs together taking about
+    slab_bytes of memory. Returns the predicted label counts and, per GT file,
+    (GT size, intersection with its label value).
+    """
+    for path in [pred_file, *gt_paths]:
+        if crop_extent(nib.load(path).header.get("descrip", b"")) is not None:
+            raise ValueError(f"{os.path.basename(path)} is a cropped label map, which cannot be streamed in slabs; "
+                             "score it without low-memory mode.")
+    shape, dtype = volume_info(pred_file)
+    # Bytes per voxel of one slab step: every volume's slab plus two boolean masks
+    voxel_bytes = dtype.itemsize + 2
+    for gt_path in gt_paths:
+        gt_shape, gt_dtype = volume_info(gt_path)
+        if gt_shape != shape:
+            raise ValueError(f"Shape mismatch: {os.path.basename(gt_path)} {gt_shape} vs prediction {shape}")
+        voxel_bytes += gt_dtype.itemsize
+    depth = slab_depth(shape, voxel_bytes, slab_bytes)
+
+    pred_counts = np.zeros(1, dtype=np.int64)
+    gt_counts = np.zeros((len(gt_paths), 2), dtype=np.int64)
+    streams = [iter_slabs(pred_file, depth=depth)] + [iter_slabs(p, depth=depth, binary=True) for p in gt_paths]
+    for slabs in tqdm(zip(*streams), total=-(-shape[2] // depth), desc="Computing Dice", unit="slab"):
+        pred_slab = slabs[0][2]
+        counts = label_counts(pred_slab)
+        if len(counts) > len(pred_counts):
+            pred_counts = np.pad(pred_counts, (0, len(counts) - len(pred_counts)))
+        pred_counts[:len(counts)] += counts
+        for i, (_, _, gt_slab) in enumerate(slabs[1:]):
+            gt_mask = gt_slab > 0
+            gt_counts[i, 0] += np.count_nonzero(gt_mask)
+            gt_counts[i, 1] += np.count_nonzero(gt_mask & (pred_slab == label_values[i]))
+        # Release this step's slabs before the next ones are read
+        slabs = pred_slab = gt_slab = gt_mask = None
+    return pred_counts, gt_counts
+
+def _score_slabs(to_score, pred_file, slab_bytes):
+    """Dice rows of every GT file, streamed slab by slab (low-memory mode)."""
+    pred_counts, gt_counts = slab_dice_counts(list(to_score), list(to_score.values()), pred_file, slab_bytes)
+    rows, dice_scores = [], []
+    for (gt_path, label_value), (size_true, intersection) in zip(to_score.items(), gt_counts):
+        size_pred = pred_counts[label_value] if label_value < len(pred_counts) else 0
+        dice = dice_from_counts(intersection, size_true, size_pred)
+        dice_scores.append(dice)
+        gt_file = os.path.basename(gt_path)
+        print(f"{gt_file} (Label {label_value}): Dice = {dice:.4f}")
+        rows.append([gt_file, label_value, f"{dice:.4f}"])
+    return rows, dice_scores
+
+def _score_in_memory(to_score, pred_file, metrics, tolerance, workers, prefetch_depth, prefetch_bytes, reorient=False):
+    """Dice (and surface metric) rows of every GT file, each decoded whole."""
+    # Cropped label maps (see utils.label_io) are expanded to their full grid
+    pred_img = nib.load(pred_file)
+    pred_data = load_label_volume(pred_file)
+    pred_affine = grid_affine(pred_img)
+    # Predicted label sizes are counted once; each GT file is then only scanned inside its bounding box
+    pred_counts = label_counts(pred_data)
+    n_pred = len(pred_counts)
+
+    if metrics:
+        spacing = surface.spacing_from_header(pred_img)
+        pred_bboxes = surface.label_bboxes(pred_data)
+        pool = ThreadPoolExecutor(max_workers=workers)
+
+    dice_scores = []
+    rows = []
+
+    # GT files only need their foreground (> 0); the prediction's labels are checked strictly
+    loader = functools.partial(load_label_volume, like=pred_affine if reorient else None, binary=True)
+    loaded = prefetch(to_score, loader, prefetch_depth, prefetch_bytes)
+    for gt_path, gt_data in tqdm(loaded, total=len(to_score), desc="Computing Dice", unit="file"):
+        gt_file = os.path.basename(gt_path)
+        label_value = to_score[gt_path]
+        if gt_data.shape != pred_data.shape:
+            raise ValueError(f"Shape mismatch: {gt_file} {gt_data.shape} vs prediction {pred_data.shape}")
+
+        bbox = foreground_bbox(gt_data)
+        hist = confusion_histogram(gt_data[bbox], pred_data[bbox], n_pred=n_pred, binary_gt=True)
+        intersection = hist[1, label_value] if label_value < n_pred else 0
+        size_pred = pred_counts[label_value] if label_value < n_pred else 0
+        dice = dice_from_counts(intersection, hist[1].sum(), size_pred)
+        dice_scores.append(dice)
+
+        print(f"{gt_file} (Label {label_value}): Dice = {dice:.4f}")
+        row = [gt_file, label_value, f"{dice:.4f}"]
+        if metrics:
+            gt_bbox = bbox if hist[1].sum() else None
+            masks = surface.crop_pair(gt_data, None, gt_bbox, pred_data, label_value, pred_bboxes.get(label_value))
+            row.append(pool.submit(surface.surface_metrics, *masks, spacing, tolerance))
+        rows.append(row)
+
+    if metrics:
+        pool.shutdown()
+        for row in rows:
+            values = row.pop().result()
+            row += [f"{values[m]:.4f}" for m in metrics]
+    return rows, dice_scores
+
+def result_rows(rows, dice_scores, metrics, subject, model):
+    """Long-format result dicts (see dice_score.results_db) from per-file CSV rows."""
+    results = []
+    for row, dice in zip(rows, dice_scores):
+        gt_file, label_value = row[0], row[1]
+        base = {"subject": subject, "model": model, "file": gt_file,
+                "label_name": os.path.splitext(os.path.splitext(gt_file)[0])[0], "pred_label": label_value}
+        results.append(dict(base, metric="dice", value=float(dice)))
+        for m, value in zip(metrics, row[3:]):
+            results.append(dict(base, metric=m, value=float(value)))
+    return results
+
+def compute_dice_per_label(gt_folder, pred_file, label_mapping, output_csv, metrics=(), tolerance=1.0, workers=None,
+                           prefetch_depth=DEFAULT_DEPTH, prefetch_bytes=None, low_memory=False, slab_bytes=DEFAULT_SLAB_BYTES,
+                           results_db=None, subject=None, model=None, reorient=False):
+    """
+    GT files are decoded on background threads ahead of the one being scored
+    (prefetch_depth files, within prefetch_bytes of memory). For each GT file:
+    - Count the predicted labels inside the GT mask (one histogram pass over its bounding box)
+    - Compute the Dice score for the mapped label
+    - Optionally compute surface metrics (metrics from surface.SURFACE_METRICS,
+      tolerance in mm for NSD), in parallel across labels
+    - Save all results to a CSV file
+    With low_memory, the prediction and the GT files are instead streamed
+    together in z slabs taking about slab_bytes in total (Dice only).
+    With results_db, every score is also stored in that results database
+    (see dice_score.results_db) under subject (default: GT folder name) and
+    model (default: prediction file name).
+    With reorient, GT volumes stored in another orientation than the
+    prediction are flipped / transposed to it before scoring (see main.preflight).
+    """
+    gt_files = sorted([f for f in os.listdir(gt_folder) if f.endswith(".nii.gz")])
+
+    if len(gt_files) == 0:
+        raise ValueError("Ground Truth folder is empty or does not contain any '.nii.gz' files.")
+
+    metrics = [m for m in surface.SURFACE_METRICS if m in metrics]
+    if metrics and low_memory:
+        raise ValueError("Surface metrics need whole volumes and are not available in low-memory mode.")
+    if reorient and low_memory:
+        raise ValueError("Reorienting GT volumes needs whole volumes and is not available in low-memory mode.")
+
+    # Get the label associated with each GT file
+    to_score = {}
+    for gt_file in gt_files:
+        label_name = os.path.splitext(os.path.splitext(gt_file)[0])[0]  # removes .nii.gz
+        label_value = label_mapping.get(label_name, None)
+
+        if label_value is None:
+            print(f"No label found for '{label_name}', skipping.")
+            continue
+        to_score[os.path.join(gt_folder, gt_file)] = label_value
+
+    if low_memory:
+        rows, dice_scores = _score_slabs(to_score, pred_file, slab_bytes)
+    else:
+        rows, dice_scores = _score_in_memory(to_score, pred_file, metrics, tolerance, workers, prefetch_depth, prefetch_bytes,
+                                             reorient)
+
+    if results_db is not None:
+        subject = subject or os.path.basename(os.path.normpath(gt_folder))
+        model = model or os.path.basename(pred_file).split(".")[0]
+        store_results(results_db, result_rows(rows, dice_scores, metrics, subject, model))
+
+    with open(output_csv, mode='w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(["File", "Label", "Dice Score"] + [surface.metric_header(m, tolerance) for m in metrics])
+        writer.writerows(rows)
+
+    if dice_scores:
+        avg_dice = np.mean(dice_scores)
+        print("\n Average Dice Score over all files:", f"{avg_dice:.4f}")
+        averages = []
+        for i, m in enumerate(metrics, start=3):
+            finite = [float(r[i]) for r in rows if np.isfinite(float(r[i]))]
+            averages.append(f"{np.mean(finite):.4f}" if finite else "")
+            print(f" Average {surface.metric_header(m, tolerance)}:", averages[-1])
+        with open(output_csv, mode='a', newline='') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow([])
+            writer.writerow(["Average Dice", "", f"{avg_dice:.4f}"] + averages)
+    else:
+        print("\n No Dice Scores were computed.")
+
+def build_parser(description="Compute Dice Scores between multiple GT files and a global predicted segmentation file.", prog=None):
+    """
+    Command line shared by the per-model Dice scripts.
+    """
+    parser = argparse.ArgumentParser(prog=prog, description=description)
+    parser.add_argument("-gt", "--ground_truth_folder", required=True, help="Folder containing GT segmentations (.nii.gz)")
+    parser.add_argument("-p", "--prediction_file", required=True, help="Global predicted segmentation file (.nii.gz)")
+    parser.add_argument("-o", "--output_csv", required=True, help="Path to save the output CSV file")
+    parser.add_argument("--metrics", nargs="+", default=[], choices=surface.SURFACE_METRICS, help="Surface metrics computed in addition to Dice")
+    parser.add_argument("--tolerance", type=float, default=1.0, help="Tolerance (mm) of the normalized surface Dice")
+    parser.add_argument("--workers", type=int, default=None, help="Threads used for surface metrics")
+    add_prefetch_arguments(parser)
+    parser.add_argument("--low_memory", action="store_true", help="Stream volumes in z slabs instead of decoding them whole")
+    parser.add_argument("--results_db", type=str, default=None, help="Also store the scores in this SQLite results database")
+    parser.add_argument("--subject", type=str, default=None, help="Subject id in the results database (default: GT folder name)")
+    parser.add_argument("--model", type=str, default=None, help="Model name in the results database (default: prediction file name)")
+    parser.add_argument("--reorient", action="store_true", help="Flip / transpose GT volumes to the orientation of the prediction")
+    parser.add_argument("--slab_mb", type=float, default=DEFAULT_SLAB_BYTES / 2 ** 20, help="Memory (MB) of the slabs held at once in low-memory mode")
+    return parser
+
+def run_from_args(args, label_mapping):
+    """Run compute_dice_per_label with options parsed by build_parser."""
+    prefetch_depth, prefetch_bytes = prefetch_options(args)
+    return compute_dice_per_label(args.ground_truth_folder, args.prediction_file, label_mapping, args.output_csv,
+                                  metrics=args.metrics, tolerance=args.tolerance, workers=args.workers,
+                                  prefetch_depth=prefetch_depth, prefetch_bytes=prefetch_bytes,
+                                  low_memory=args.low_memory, slab_bytes=int(args.slab_mb * 2 ** 20),
+                                  results_db=args.results_db, subject=args.subject, model=args.model, reorient=args.reorient)
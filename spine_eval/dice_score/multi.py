@@ -0,0 +1,175 @@
+import argparse
+import csv
+import json
+import os
+import nibabel as nib
+import numpy as np
+
+from spine_eval.dice_score.engine import label_counts, confusion_histogram, dice_from_counts
+from spine_eval.dice_score.results_db import RESULT_COLUMNS, store_results
+from spine_eval.utils.prefetch import DEFAULT_DEPTH, prefetch, add_prefetch_arguments, prefetch_options
+from spine_eval.utils.roi import foreground_bbox, union_bbox
+from spine_eval.utils.volume import as_mask_array, load_label_volume
+
+def builtin_mappings():
+    """Label mappings shipped with the per-model scripts, usable by name on the command line."""
+    from spine_eval.dice_score import ds_ts, ds_spineps
+    return {"ts": ds_ts.LABEL_MAPPING, "spineps": ds_spineps.LABEL_MAPPING}
+
+RESULT_FIELDS = RESULT_COLUMNS
+
+class PackedGroundTruth:
+    """
+    All per-disc GT files of a subject decoded once into a single uint8 label
+    volume: voxel value i is the i-th GT file (names[i - 1]), 0 is background.
+    sizes[i] is the voxel count of GT file i and bbox the union of their
+    foreground bounding boxes. GT files that lose voxels to a later,
+    overlapping file cannot be scored from the packed volume: overlapping maps
+    their packed label to (bbox, cropped mask) of the whole file.
+    """
+    def __init__(self, labels, names, files, sizes, bbox, affine, overlapping=None):
+        self.labels = labels
+        self.names = names
+        self.files = files
+        self.sizes = sizes
+        self.bbox = bbox
+        self.affine = affine
+        self.overlapping = overlapping or {}
+
+    def index(self, name):
+        """Packed label of a GT name, or None."""
+        return self.names.index(name) + 1 if name in self.names else None
+
+def _load_with_affine(path):
+    img = nib.load(path)
+    return as_mask_array(np.asanyarray(img.dataobj)), img.affine
+
+def pack_ground_truth(gt_folder, prefetch_depth=DEFAULT_DEPTH, prefetch_bytes=None):
+    """
+    Decode every .nii.gz GT file of gt_folder once and pack them into one
+    uint8 label volume. Overlapping GT voxels keep the later file's label;
+    the cropped masks of the files they were taken from are kept aside, so
+    those files are scored on their own (see score_prediction).
+    Files are decoded ahead on background threads (see utils.prefetch).
+    """
+    files = sorted([f for f in os.listdir(gt_folder) if f.endswith(".nii.gz")])
+    if len(files) == 0:
+        raise ValueError("Ground Truth folder is empty or does not contain any '.nii.gz' files.")
+    if len(files) > 255:
+        raise ValueError(f"Cannot pack {len(files)} GT files into a uint8 label volume.")
+
+    labels = None
+    affine = None
+    names, sizes, bboxes, masks, overlapping = [], [0], [], [], {}
+    loaded = prefetch([os.path.join(gt_folder, f) for f in files], _load_with_affine, prefetch_depth, prefetch_bytes)
+    for i, (gt_path, (gt_data, gt_affine)) in enumerate(loaded, start=1):
+        gt_file = os.path.basename(gt_path)
+        if labels is None:
+            labels = np.zeros(gt_data.shape, dtype=np.uint8, order='F')
+            affine = gt_affine
+        elif gt_data.shape != labels.shape:
+            raise ValueError(f"Shape mismatch: {gt_file} {gt_data.shape} vs {labels.shape}")
+
+        bbox = foreground_bbox(gt_data)
+        mask = gt_data[bbox] > 0
+        covered = labels[bbox][mask]
+        if covered.any():
+            overlapped = np.unique(covered[covered > 0])
+            print(f"Warning: {gt_file} overlaps {', '.join(files[g - 1] for g in overlapped)} on "
+                  f"{np.count_nonzero(covered)} voxels; those files are scored separately.")
+            for g in overlapped:
+                overlapping[int(g)] = (bboxes[g - 1], masks[g - 1])
+        labels[bbox][mask] = i
+
+        names.append(os.path.splitext(os.path.splitext(gt_file)[0])[0])  # removes .nii.gz
+        sizes.append(int(np.count_nonzero(mask)))
+        bboxes.append(bbox)
+        masks.append(mask)
+
+    return PackedGroundTruth(labels, names, files, np.array(sizes), union_bbox(*bboxes), affine, overlapping)
+
+def score_prediction(packed, pred_data, label_mapping):
+    """
+    Dice of every mapped GT label against one prediction, from a single
+    confusion histogram over the GT bounding box.
+    Returns a list of (gt_name, pred_label, dice).
+    """
+    if pred_data.shape != packed.labels.shape:
+        raise ValueError(f"Shape mismatch: prediction {pred_data.shape} vs GT {packed.labels.shape}")
+    pred_counts = label_counts(pred_data)
+    n_pred = len(pred_counts)
+    hist = confusion_histogram(packed.labels[packed.bbox], pred_data[packed.bbox],
+                               n_gt=len(packed.names) + 1, n_pred=n_pred)
+
+    scores = []
+    for g, name in enumerate(packed.names, start=1):
+        value = label_mapping.get(name)
+        if value is None:
+            continue
+        if g in packed.overlapping:
+            # Part of this file is packed under a later file's label: score its own mask
+            bbox, mask = packed.overlapping[g]
+            intersection = np.count_nonzero(mask & (pred_data[bbox] == value))
+        else:
+            intersection = hist[g, value] if value < n_pred else 0
+        size_pred = pred_counts[value] if value < n_pred else 0
+        scores.append((name, value, dice_from_counts(intersection, packed.sizes[g], size_pred)))
+    return scores
+
+def evaluate_predictions(gt_folder, predictions, output_csv, subject=None, prefetch_depth=DEFAULT_DEPTH, prefetch_bytes=None,
+                         results_db=None):
+    """
+    Score N predictions of one subject against its GT, decoded once.
+    predictions: list of (model_name, pred_file, label_mapping); the next
+    predictions are decoded on background threads while one is scored.
+    Writes one long-format table (one row per subject, model, label and metric),
+    also stored in results_db if given, and returns its rows.
+    """
+    packed = pack_ground_truth(gt_folder, prefetch_depth, prefetch_bytes)
+    subject = subject or os.path.basename(os.path.normpath(gt_folder))
+
+    rows = []
+    loaded = prefetch([pred_file for _, pred_file, _ in predictions], load_label_volume, prefetch_depth, prefetch_bytes)
+    for (model, pred_file, label_mapping), (_, pred_data) in zip(predictions, loaded):
+        missing = [n for n in packed.names if n not in label_mapping]
+        if missing:
+            print(f"[{model}] No label found for {', '.join(missing)}, skipping.")
+        for name, value, dice in score_prediction(packed, pred_data, label_mapping):
+            rows.append({"subject": subject, "model": model, "file": name + ".nii.gz", "label_name": name,
+                         "pred_label": value, "metric": "dice", "value": f"{dice:.4f}"})
+            print(f"[{model}] {name} (Label {value}): Dice = {dice:.4f}")
+
+    if results_db is not None:
+        store_results(results_db, rows)
+
+    with open(output_csv, mode='w', newline='') as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=RESULT_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    return rows
+
+def load_mapping(spec):
+    """A built-in mapping name ('ts', 'spineps') or a JSON file of name -> label."""
+    builtins = builtin_mappings()
+    if spec in builtins:
+        return builtins[spec]
+    with open(spec) as f:
+        return {name: int(value) for name, value in json.load(f).items()}
+
+def cli(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Compute Dice Scores of several predictions against GT files decoded once.")
+    parser.add_argument("-gt", "--ground_truth_folder", required=True, help="Folder containing GT segmentations (.nii.gz)")
+    parser.add_argument("-p", "--prediction", nargs=3, action="append", required=True, metavar=("MODEL", "FILE", "MAPPING"),
+                        help="Model name, predicted segmentation (.nii.gz) and label mapping ('ts', 'spineps' or a JSON file). Repeatable.")
+    parser.add_argument("-o", "--output_csv", required=True, help="Path to save the combined long-format CSV")
+    parser.add_argument("--subject", default=None, help="Subject id written in the table (default: GT folder name)")
+    add_prefetch_arguments(parser)
+    parser.add_argument("--results_db", type=str, default=None, help="Also store the scores in this SQLite results database")
+    args = parser.parse_args(argv)
+
+    predictions = [(model, path, load_mapping(mapping)) for model, path, mapping in args.prediction]
+    evaluate_predictions(args.ground_truth_folder, predictions, args.output_csv, args.subject, *prefetch_options(args),
+                         results_db=args.results_db)
+
+if __name__ == "__main__":
+    cli()
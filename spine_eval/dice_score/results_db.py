@@ -0,0 +1,147 @@
+import argparse
+import csv
+import sqlite3
+import statistics
+import time
+
+# Columns of the long-format results table (same as dice_score.multi.RESULT_FIELDS)
+RESULT_COLUMNS = ["subject", "model", "file", "label_name", "pred_label", "metric", "value"]
+
+# Columns results can be grouped by in aggregate()
+GROUP_COLUMNS = ["subject", "model", "label_name", "metric"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    subject    TEXT NOT NULL,
+    model      TEXT NOT NULL,
+    file       TEXT,
+    label_name TEXT NOT NULL,
+    pred_label INTEGER,
+    metric     TEXT NOT NULL,
+    value      REAL,
+    updated    REAL NOT NULL,
+    PRIMARY KEY (subject, model, label_name, metric)
+);
+CREATE INDEX IF NOT EXISTS results_by_model_label ON results (model, label_name, metric);
+"""
+
+class ResultsStore:
+    """
+    Cohort-level results in one SQLite table, one row per subject, model,
+    label and metric. Rerunning a subject replaces its rows. The database is
+    in WAL mode with a busy timeout, so batch workers in separate processes
+    can write to it concurrently; open one store per process.
+    """
+    def __init__(self, path, timeout=60.0):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=timeout)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+
+    def add(self, rows):
+        """Insert (or replace) result rows given as dicts with RESULT_COLUMNS keys."""
+        now = time.time()
+        values = [tuple(row.get(c) for c in RESULT_COLUMNS) + (now,) for row in rows]
+        with self.conn:
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO results ({', '.join(RESULT_COLUMNS)}, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                values)
+        return len(values)
+
+    def rows(self, metric=None, model=None, subject=None):
+        """Result rows as dicts, optionally filtered."""
+        where, args = self._where(metric=metric, model=model, subject=subject)
+        cursor = self.conn.execute(
+            f"SELECT {', '.join(RESULT_COLUMNS)} FROM results{where} ORDER BY subject, model, label_name, metric", args)
+        return [dict(zip(RESULT_COLUMNS, r)) for r in cursor]
+
+    def aggregate(self, by=("model", "label_name"), metric="dice"):
+        """
+        Per-group count, mean, median, min and max of one metric.
+        by: columns from GROUP_COLUMNS. Count, mean, min and max are computed
+        in SQL; the median from the values of each group.
+        """
+        by = list(by)
+        unknown = [c for c in by if c not in GROUP_COLUMNS]
+        if unknown:
+            raise ValueError(f"Cannot group by {', '.join(unknown)}. Choose from: {', '.join(GROUP_COLUMNS)}")
+        where, args = self._where(metric=metric)
+        group = ", ".join(by)
+        select = (group + ", ") if by else ""
+        order = f" GROUP BY {group} ORDER BY {group}" if by else ""
+        summary = []
+        for r in self.conn.execute(
+                f"SELECT {select}COUNT(value), AVG(value), MIN(value), MAX(value) FROM results{where}{order}", args):
+            summary.append(dict(zip(by + ["count", "mean", "min", "max"], r)))
+
+        medians = {}
+        cursor = self.conn.execute(f"SELECT {select}value FROM results{where}", args)
+        for r in cursor:
+            medians.setdefault(tuple(r[:-1]), []).append(r[-1])
+        for s in summary:
+            values = [v for v in medians.get(tuple(s[c] for c in by), []) if v is not None]
+            s["median"] = statistics.median(values) if values else None
+        return summary
+
+    def export_csv(self, path, metric=None, model=None):
+        """Write the (optionally filtered) long-format table as CSV."""
+        rows = self.rows(metric=metric, model=model)
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=RESULT_COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+        return len(rows)
+
+    def import_csv(self, path):
+        """Load a long-format CSV (e.g. written by dice_score.multi) into the store."""
+        with open(path, newline='') as f:
+            return self.add(list(csv.DictReader(f)))
+
+    @staticmethod
+    def _where(**filters):
+        filters = {k: v for k, v in filters.items() if v is not None}
+        if not filters:
+            return "", []
+        return " WHERE " + " AND ".join(f"{k} = ?" for k in filters), list(filters.values())
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def store_results(db_path, rows):
+    """Append rows to the results database at db_path (opened and closed in this call)."""
+    with ResultsStore(db_path) as store:
+        return store.add(rows)
+
+def print_aggregate(summary, by):
+    header = "".join(f"{c:>20s} " for c in by) + f"{'n':>7s}{'mean':>9s}{'median':>9s}{'min':>9s}{'max':>9s}"
+    print(header)
+    for s in summary:
+        values = "".join(f"{s[k]:9.4f}" if s[k] is not None else f"{'':9s}" for k in ("mean", "median", "min", "max"))
+        print("".join(f"{str(s[c]):>20s} " for c in by) + f"{s['count']:7d}" + values)
+
+def cli(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Query, import or export the cohort results database (SQLite).")
+    parser.add_argument("--db", type=str, required=True, help="Results database file")
+    parser.add_argument("--metric", type=str, default="dice", help="Metric to aggregate or export")
+    parser.add_argument("--by", type=str, nargs="*", default=["model", "label_name"], choices=GROUP_COLUMNS, help="Columns to group by")
+    parser.add_argument("--import_csv", type=str, nargs="+", default=[], help="Long-format CSV files to load into the database")
+    parser.add_argument("--export", type=str, default=None, help="Write the rows of --metric as CSV to this path")
+    args = parser.parse_args(argv)
+
+    with ResultsStore(args.db) as store:
+        for path in args.import_csv:
+            print(f"Imported {store.import_csv(path)} rows from {path}")
+        if args.export:
+            print(f"Exported {store.export_csv(args.export, metric=args.metric)} rows to {args.export}")
+        else:
+            print_aggregate(store.aggregate(args.by, args.metric), args.by)
+
+if __name__ == "__main__":
+    cli()
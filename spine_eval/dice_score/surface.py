@@ -0,0 +1,75 @@
+import numpy as np
+
+from spine_eval.utils.roi import union_bbox
+
+# SimpleITK (also behind utils.components) is imported by the functions that
+# use it, so the Dice tools can import this module for SURFACE_METRICS and
+# metric_header without loading it
+
+# Opt-in metrics computed in addition to Dice
+SURFACE_METRICS = ("hd95", "assd", "nsd")
+
+def spacing_from_header(img):
+    """Voxel spacing (mm) of a nibabel image, in array axis order."""
+    return tuple(float(s) for s in img.header.get_zooms()[:3])
+
+def label_bboxes(label_arr):
+    """Bounding box of every label value of an array, from one component_stats pass."""
+    from spine_eval.utils.components import component_stats
+    stats = component_stats(label_arr)
+    return {int(label): stats.bbox_slices(label) for label in stats.present()}
+
+def _grow(bbox, shape, margin=1):
+    # One voxel of margin so that contours are the same as in the full volume
+    return tuple(slice(max(s.start - margin, 0), min(s.stop + margin, n)) for s, n in zip(bbox, shape))
+
+def _surface_and_distance(mask, spacing):
+    """Surface voxels of a cropped mask and the distance (mm) of every voxel to that surface."""
+    import SimpleITK as sitk
+    img = sitk.GetImageFromArray(mask.astype(np.uint8))
+    img.SetSpacing(tuple(reversed(spacing)))  # sitk reads the array axes in reverse order
+    contour = sitk.BinaryContour(img, fullyConnected=False, backgroundValue=0, foregroundValue=1)
+    distance = sitk.SignedMaurerDistanceMap(contour, insideIsPositive=False, squaredDistance=False, useImageSpacing=True)
+    surface = sitk.GetArrayViewFromImage(contour).astype(bool)
+    return surface, np.maximum(sitk.GetArrayFromImage(distance), 0)
+
+def surface_metrics(gt_mask, pred_mask, spacing, tolerance=1.0):
+    """
+    HD95, average symmetric surface distance and normalized surface Dice at
+    tolerance (mm) between two boolean masks of the same (cropped) shape.
+    """
+    gt_any, pred_any = gt_mask.any(), pred_mask.any()
+    if not gt_any and not pred_any:
+        return {"hd95": 0.0, "assd": 0.0, "nsd": 1.0}
+    if not gt_any or not pred_any:
+        return {"hd95": float("inf"), "assd": float("inf"), "nsd": 0.0}
+
+    gt_surface, gt_distance = _surface_and_distance(gt_mask, spacing)
+    pred_surface, pred_distance = _surface_and_distance(pred_mask, spacing)
+    pred_to_gt = gt_distance[pred_surface]
+    gt_to_pred = pred_distance[gt_surface]
+
+    n = len(pred_to_gt) + len(gt_to_pred)
+    return {
+        "hd95": float(max(np.percentile(pred_to_gt, 95), np.percentile(gt_to_pred, 95))),
+        "assd": float((pred_to_gt.sum() + gt_to_pred.sum()) / n),
+        "nsd": float((np.count_nonzero(pred_to_gt <= tolerance) + np.count_nonzero(gt_to_pred <= tolerance)) / n),
+    }
+
+def crop_pair(gt_data, gt_value, gt_bbox, pred_data, pred_value, pred_bbox):
+    """
+    Boolean masks of one (GT label, predicted label) pair, cropped to the union
+    of their bounding boxes (plus one voxel). gt_value None means any non-zero
+    GT voxel; a None bbox means the label is absent.
+    """
+    boxes = [b for b in (gt_bbox, pred_bbox) if b is not None]
+    if not boxes:
+        return np.zeros((1, 1, 1), bool), np.zeros((1, 1, 1), bool)
+    bbox = _grow(union_bbox(*boxes), gt_data.shape)
+    gt_crop = gt_data[bbox]
+    gt_mask = gt_crop > 0 if gt_value is None else gt_crop == gt_value
+    return gt_mask, pred_data[bbox] == pred_value
+
+def metric_header(name, tolerance):
+    """CSV column name of a surface metric."""
+    return {"hd95": "HD95 (mm)", "assd": "ASSD (mm)", "nsd": f"NSD@{tolerance:g}mm"}[name]
@@ -0,0 +1,316 @@
+import argparse
+import os
+
+# SimpleITK, nibabel and numpy are imported by the stages that use them, so
+# importing this module (or asking for --help) stays fast
+from spine_eval.utils.gzip_check import check_and_fix_gzip as check
+from spine_eval.main.backends import SubprocessBackend, get_backend, BACKENDS
+from spine_eval.main.cache import SegmentationCache, hash_file, make_key
+from spine_eval.main.dag import Stage, StageGraph, STATE_NAME
+from spine_eval.main.instrument import Tracer, NULL_TRACER
+from spine_eval.utils.threads import add_thread_arguments, core_budget, set_thread_budget
+
+# Segmentation arguments, also part of the cache key
+TASK = "total_mr"
+ROI_SUBSET = ["intervertebral_discs"]
+
+# Per-subject stage trace written in the work dir when tracing is enabled
+TRACE_NAME = "trace.jsonl"
+
+# Disc names from bottom to top, assigned by separate()
+DISC_LABELS = ["L5-Sacrum", "L4-L5", "L3-L4", "L2-L3", "L1-L2", "T12-L1", "T11-T12", "T10-T11", "T9-T10", "T8-T9", "T7-T8", "T6-T7", "T5-T6", "T4-T5", "T3-T4", "T2-T3", "T1-T2"]
+
+# Model name under which scores are stored in the results database
+MODEL_NAME = "TotalSegmentator"
+
+# Define the mapping of labels to their corresponding values
+## Specific for the OSF dataset. Change if needed.
+LABEL_MAPPING = {
+    "BS_L1_2": 5,
+    "BS_L2_3": 4,
+    "BS_L3_4": 3,
+    "BS_L4_5": 2
+}
+
+def run_total_segmentator(input_img, output_folder, backend=None):
+    backend = backend or SubprocessBackend()
+    print(f"Running TotalSegmentator ({backend.name} backend)...")
+    backend.segment(input_img, output_folder, task=TASK, roi_subset=ROI_SUBSET)
+    print("TotalSegmentator finished.")
+
+def subject_paths(work_dir):
+    """Files written by the pipeline for one subject."""
+    seg_output_folder = os.path.join(work_dir, "segmentation_output")
+    return {
+        "seg_output_folder": seg_output_folder,
+        "disc_mask_path": os.path.join(seg_output_folder, "intervertebral_discs.nii.gz"),
+        "labeled_discs_path": os.path.join(work_dir, "labeled_discs.nii.gz"),
+        "label_txt_path": os.path.join(work_dir, "label_txt_path_labels.txt"),
+        "output_csv": os.path.join(work_dir, "dice_scores.csv"),
+    }
+
+def segmentation_files():
+    return [f"{roi}.nii.gz" for roi in ROI_SUBSET]
+
+def label_files(paths):
+    return [os.path.basename(paths["labeled_discs_path"]), os.path.basename(paths["label_txt_path"])]
+
+def label_code():
+    """Modules implementing disc labeling, part of the labels' cache key and stage fingerprint."""
+    from spine_eval.utils import components, gzip_check, label_io, roi, separate_if_sacrum, volume
+    return [separate_if_sacrum, components, roi, label_io, gzip_check, volume]
+
+def cache_keys(image, backend_version, disc_labels=DISC_LABELS):
+    """Cache keys of the segmentation and of the labeled discs of an image."""
+    from spine_eval.utils.separate_if_sacrum import MIN_DISC_VOLUME
+    seg_key = make_key(hash_file(image), TASK, ROI_SUBSET, backend_version)
+    # Labels depend on which components are kept as discs, and on the labeling code
+    code = [hash_file(module.__file__) for module in label_code()]
+    return seg_key, make_key(seg_key, list(disc_labels), MIN_DISC_VOLUME, code)
+
+def fetch_cached(cache, seg_key, label_key, paths):
+    """Restore cached outputs into the work dir. Returns (segmentation hit, labels hit)."""
+    seg_hit = cache.fetch(seg_key, paths["seg_output_folder"], segmentation_files())
+    label_hit = seg_hit and cache.fetch(label_key, os.path.dirname(paths["labeled_discs_path"]), label_files(paths))
+    return seg_hit, label_hit
+
+def lookup_cache(cache, image, backend_version, paths, disc_labels=DISC_LABELS):
+    """Restore the cached outputs of an image. Returns (segmentation key, labels key, segmentation hit, labels hit)."""
+    seg_key, label_key = cache_keys(image, backend_version, disc_labels)
+    seg_hit, label_hit = fetch_cached(cache, seg_key, label_key, paths)
+    print(f"Segmentation cache {'hit' if seg_hit else 'miss'} for {image}")
+    return seg_key, label_key, seg_hit, label_hit
+
+def convert_image(image, seg_output_folder):
+    from spine_eval.utils.mha2nifti import mha_to_nifti as m2n
+    # Convert .mha to .nii.gz (fast compression, it is only an intermediate)
+    return m2n(image, seg_output_folder, compression="fast")[0]
+
+def label_discs(paths, disc_labels=DISC_LABELS):
+    from spine_eval.utils.separate_if_sacrum import separate
+    separate(paths["disc_mask_path"], paths["labeled_discs_path"], paths["label_txt_path"], disc_labels=disc_labels)
+
+def score_dice(ground_truth, paths, label_mapping=LABEL_MAPPING, results_db=None, reorient=False):
+    from spine_eval.dice_score.engine import compute_dice_per_label
+    # The work dir names the subject in the cohort results database
+    subject = os.path.basename(os.path.normpath(os.path.dirname(paths["output_csv"])))
+    compute_dice_per_label(ground_truth, paths["labeled_discs_path"], label_mapping, paths["output_csv"],
+                           results_db=results_db, subject=subject, model=MODEL_NAME, reorient=reorient)
+    return paths["output_csv"]
+
+def segment_cached(image, nifti_image, seg_output_folder, cache=None, backend=None):
+    """Segment nifti_image, or restore the cached segmentation of image (the pipeline input)."""
+    if cache is not None:
+        seg_key, _ = cache_keys(image, backend.version())
+        if cache.fetch(seg_key, seg_output_folder, segmentation_files()):
+            print(f"Segmentation cache hit for {image}")
+            return
+    run_total_segmentator(nifti_image, seg_output_folder, backend)
+    if cache is not None:
+        cache.store(seg_key, seg_output_folder, segmentation_files(), meta={"image": image, "stage": "segment"})
+
+def label_cached(image, paths, disc_labels=DISC_LABELS, cache=None, backend_version=None):
+    """Label the discs, or restore the cached labels of image (the pipeline input)."""
+    if cache is not None:
+        _, label_key = cache_keys(image, backend_version, disc_labels)
+        if cache.fetch(label_key, os.path.dirname(paths["labeled_discs_path"]), label_files(paths)):
+            print(f"Label cache hit for {image}")
+            return
+    label_discs(paths, disc_labels)
+    if cache is not None:
+        cache.store(label_key, os.path.dirname(paths["labeled_discs_path"]), label_files(paths), meta={"image": image, "stage": "label"})
+
+def pipeline_steps(image, ground_truth, paths, backend_version=None, cache=None, disc_labels=DISC_LABELS,
+                   label_mapping=LABEL_MAPPING, results_db=None, reorient=False):
+    """
+    The stages of one full pipeline run, as a generator of main.dag.Stage:
+    cache lookup, conversion, gzip check, segmentation, disc labeling and
+    Dice, skipping what the cache restored. The caller runs each yielded
+    stage and sends its result back (see run_steps and main.scheduler, which
+    runs them in per-resource pools). Returns the path of the Dice CSV.
+    """
+    seg_hit = label_hit = False
+    if cache is not None:
+        seg_key, label_key, seg_hit, label_hit = yield Stage(
+            "cache", lookup_cache, args=(cache, image, backend_version, paths, disc_labels), resource="io")
+
+    if not seg_hit:
+        #check if mha
+        if image.endswith(".mha"):
+            image = yield Stage("convert", convert_image, args=(image, paths["seg_output_folder"]), resource="io")
+
+        #check if the gzip is actually a gzip file, if not fix it.
+        yield Stage("gzip_check", check, args=(image,), resource="io")
+
+        # Step 1: TotalSegmentator
+        yield Stage("segment", run_total_segmentator, args=(image, paths["seg_output_folder"]), resource="segment")
+        if cache is not None:
+            yield Stage("cache_store", cache.store, args=(seg_key, paths["seg_output_folder"], segmentation_files(),
+                                                          {"image": image, "stage": "segment"}), resource="io")
+
+    # Step 2: Label discs
+    if not label_hit:
+        yield Stage("separate", label_discs, args=(paths, disc_labels))
+        if cache is not None:
+            yield Stage("cache_store", cache.store, args=(label_key, os.path.dirname(paths["labeled_discs_path"]),
+                                                          label_files(paths), {"image": image, "stage": "label"}), resource="io")
+
+    # Step 3: DICE computation
+    return (yield Stage("dice", score_dice, args=(ground_truth, paths, label_mapping, results_db, reorient)))
+
+def run_stage(stage, backend=None, tracer=NULL_TRACER, **fields):
+    """Run one stage as a traced step; segmentations also record the usage of the backend's model process."""
+    if stage.resource != "segment":
+        with tracer.stage(stage.name, **fields):
+            return stage()
+    with tracer.stage(stage.name, backend=backend.name, **fields) as record:
+        backend.last_usage = None
+        try:
+            return stage(backend)
+        finally:
+            # CPU time and peak RSS of the model's own process for this job (see main.backends)
+            record.update(backend.last_usage or {})
+
+def run_steps(steps, backend=None, tracer=NULL_TRACER):
+    """Run the stages of a pipeline_steps or StageGraph.steps generator in turn. Returns the generator's value."""
+    result = None
+    try:
+        while True:
+            result = run_stage(steps.send(result), backend, tracer)
+    except StopIteration as stop:
+        return stop.value
+
+def run_pipeline(image, ground_truth, work_dir, backend=None, cache=None, tracer=None, results_db=None, reorient=False,
+                 disc_labels=DISC_LABELS, label_mapping=LABEL_MAPPING):
+    """
+    Run conversion, segmentation, disc labeling and Dice computation for one subject.
+    backend is a main.backends.SegmentationBackend (the TotalSegmentator CLI by default).
+    cache is an optional main.cache.SegmentationCache: on a hit, the segmentation
+    and labeled discs are reused and only the Dice computation runs.
+    tracer is an optional main.instrument.Tracer recording each stage.
+    results_db is an optional SQLite results database the scores are added to.
+    reorient flips / transposes GT volumes to the orientation of the prediction
+    (set for subjects the pre-flight check reports as fixable, see main.preflight).
+    label_mapping maps GT file names to disc labels (default: OSF mapping).
+    Returns the path of the Dice CSV written in work_dir.
+    """
+    backend = backend or SubprocessBackend()
+    paths = subject_paths(work_dir)
+    os.makedirs(paths["seg_output_folder"], exist_ok=True)
+    steps = pipeline_steps(image, ground_truth, paths, backend.version() if cache is not None else None, cache,
+                           disc_labels, label_mapping, results_db, reorient)
+    return run_steps(steps, backend, tracer or NULL_TRACER)
+
+def pipeline_dag(image, ground_truth, work_dir, backend=None, cache=None, disc_labels=DISC_LABELS, label_mapping=LABEL_MAPPING,
+                 results_db=None, reorient=False):
+    """
+    The pipeline of one subject as a main.dag.StageGraph:
+    convert -> check -> segment -> label -> evaluate.
+    Each stage declares its input files, parameters, implementing modules and
+    outputs, so only the stages whose fingerprint changed are rerun. The
+    segmentation and labels are restored from cache when it holds them, under
+    the same keys as run_pipeline. backend is only used for its version: the
+    segment stage runs on the backend given to StageGraph.run (or run_steps).
+    """
+    from spine_eval.utils.mha2nifti import output_path
+    from spine_eval.utils import gzip_check, mha2nifti
+    from spine_eval.dice_score import engine
+
+    backend = backend or SubprocessBackend()
+    paths = subject_paths(work_dir)
+    os.makedirs(paths["seg_output_folder"], exist_ok=True)
+    graph = StageGraph(os.path.join(work_dir, STATE_NAME))
+
+    nifti_image = image
+    if image.endswith(".mha"):
+        nifti_image = output_path(image, paths["seg_output_folder"], compression="fast")
+        graph.add(Stage("convert", convert_image, args=(image, paths["seg_output_folder"]), resource="io",
+                        inputs=[image], outputs=[nifti_image], params={"compression": "fast"}, code=[mha2nifti]))
+
+    graph.add(Stage("check", check, args=(nifti_image,), resource="io", inputs=[nifti_image], code=[gzip_check]))
+
+    seg_outputs = [os.path.join(paths["seg_output_folder"], f) for f in segmentation_files()]
+    graph.add(Stage("segment", segment_cached, args=(image, nifti_image, paths["seg_output_folder"], cache), resource="segment",
+                    inputs=[nifti_image], outputs=seg_outputs,
+                    params={"task": TASK, "roi_subset": ROI_SUBSET, "backend": backend.version()}))
+
+    graph.add(Stage("label", label_cached, args=(image, paths, disc_labels, cache, backend.version()),
+                    inputs=[paths["disc_mask_path"]], outputs=[paths["labeled_discs_path"], paths["label_txt_path"]],
+                    params={"disc_labels": list(disc_labels)}, code=label_code()))
+
+    graph.add(Stage("evaluate", score_dice, args=(ground_truth, paths, label_mapping, results_db, reorient),
+                    inputs=[paths["labeled_discs_path"], ground_truth], outputs=[paths["output_csv"]],
+                    params={"label_mapping": label_mapping, "results_db": results_db and os.path.abspath(results_db),
+                            "reorient": reorient},
+                    code=[engine]))
+    return graph
+
+def run_pipeline_incremental(image, ground_truth, work_dir, backend=None, cache=None, tracer=None,
+                             disc_labels=DISC_LABELS, label_mapping=LABEL_MAPPING, force=(), results_db=None, reorient=False):
+    """
+    Like run_pipeline, but only reruns the stages whose inputs, parameters or
+    code changed since the last run in work_dir (see pipeline_dag).
+    force: stage names to rerun anyway.
+    """
+    backend = backend or SubprocessBackend()
+    graph = pipeline_dag(image, ground_truth, work_dir, backend, cache, disc_labels, label_mapping, results_db, reorient)
+    results = run_steps(graph.steps(force), backend, tracer or NULL_TRACER)
+    print("Stages: " + ", ".join(f"{name} {result}" for name, result in results.items()))
+    return subject_paths(work_dir)["output_csv"]
+
+def backend_from_args(args):
+    kwargs = {"mask_source": args.stand_in_mask} if args.backend == "stand-in" else {}
+    return get_backend(args.backend, **kwargs)
+
+def cache_from_args(args):
+    if args.cache_dir is None:
+        return None
+    max_bytes = int(args.cache_max_gb * 1e9) if args.cache_max_gb is not None else None
+    return SegmentationCache(args.cache_dir, max_bytes)
+
+def tracer_from_args(args):
+    if not args.trace:
+        return None
+    os.makedirs(args.work_dir, exist_ok=True)
+    return Tracer(os.path.join(args.work_dir, TRACE_NAME), subject=args.image)
+
+def main(args):
+    budget = core_budget(args.threads)
+    if budget is not None:
+        # Before the backend starts and before SimpleITK / NumPy are imported
+        set_thread_budget(budget)
+    label_mapping = LABEL_MAPPING
+    if args.label_mapping:
+        from spine_eval.utils.vertebrae import load_label_map
+        label_mapping = load_label_map(args.label_mapping)
+    with backend_from_args(args) as backend:
+        if args.incremental:
+            return run_pipeline_incremental(args.image, args.ground_truth, args.work_dir, backend, cache_from_args(args),
+                                            tracer_from_args(args), label_mapping=label_mapping, force=args.force,
+                                            results_db=args.results_db, reorient=args.reorient)
+        return run_pipeline(args.image, args.ground_truth, args.work_dir, backend, cache_from_args(args), tracer_from_args(args),
+                            args.results_db, args.reorient, label_mapping=label_mapping)
+
+
+def cli(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Pipeline runner with internal imports")
+    parser.add_argument("--image", type=str, required=True)
+    parser.add_argument("--ground_truth", type=str, required=True)
+    parser.add_argument("--work_dir", type=str, required=True)
+    parser.add_argument("--backend", type=str, default="subprocess", choices=list(BACKENDS), help="Segmentation backend")
+    parser.add_argument("--stand_in_mask", type=str, default=None, help="Mask file or folder used by the stand-in backend")
+    parser.add_argument("--cache_dir", type=str, default=None, help="Reuse segmentation outputs cached in this folder")
+    parser.add_argument("--cache_max_gb", type=float, default=None, help="Size limit of the cache (LRU eviction)")
+    parser.add_argument("--trace", action="store_true", help="Record per-stage time, CPU, memory and I/O to <work_dir>/trace.jsonl")
+    parser.add_argument("--results_db", type=str, default=None, help="Also add the scores to this SQLite results database")
+    parser.add_argument("--incremental", action="store_true", help="Only rerun stages whose inputs, parameters or code changed")
+    parser.add_argument("--label_mapping", type=str, default=None, help="JSON file of GT name -> disc label (default: OSF mapping)")
+    parser.add_argument("--force", type=str, nargs="+", default=[], help="With --incremental, stages to rerun anyway")
+    parser.add_argument("--reorient", action="store_true", help="Flip / transpose GT volumes to the orientation of the prediction")
+    add_thread_arguments(parser)
+    args = parser.parse_args(argv)
+
+    return main(args)
+
+if __name__ == "__main__":
+    cli()
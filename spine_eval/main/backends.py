@@ -0,0 +1,255 @@
+import multiprocessing as mp
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import threading
+
+# Default TotalSegmentator arguments used by the pipeline
+DEFAULT_TASK = "total_mr"
+DEFAULT_ROI_SUBSET = ("intervertebral_discs",)
+
+# Seconds between checks that the segmentation worker is still alive while waiting for it
+WORKER_POLL_INTERVAL = 1.0
+
+def totalsegmentator_version():
+    """Return the installed TotalSegmentator version, or 'unknown'."""
+    try:
+        from importlib.metadata import version
+        return version("TotalSegmentator")
+    except Exception:
+        return "unknown"
+
+def _output_fd(stream):
+    # File descriptor behind sys.stdout / sys.stderr (a subject's log under
+    # main.scheduler), or None to inherit when the stream has none
+    try:
+        return stream.fileno()
+    except (AttributeError, OSError, ValueError):
+        return None
+
+def _proc_usage(pid):
+    """CPU seconds (user, system) and peak RSS bytes (VmHWM) of a running process, from /proc (Linux), or None."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/status") as f:
+            hwm = next(int(line.split()[1]) * 1024 for line in f if line.startswith("VmHWM:"))
+    except (OSError, StopIteration, IndexError, ValueError):
+        return None
+    ticks = os.sysconf("SC_CLK_TCK")
+    return int(fields[11]) / ticks, int(fields[12]) / ticks, hwm
+
+def _reset_peak_rss(pid):
+    # Reset VmHWM of a child process (Linux), so its peak is measured per job
+    try:
+        with open(f"/proc/{pid}/clear_refs", 'w') as f:
+            f.write("5")
+    except OSError:
+        pass
+
+class SegmentationBackend:
+    """
+    Interface for anything that turns an image into TotalSegmentator-style outputs
+    (one <roi>.nii.gz per requested structure in output_folder).
+    Backends running the model in another process set last_usage after each
+    segment() call to that process's usage for the job, as trace fields
+    (child_cpu_user_s, child_cpu_sys_s, child_peak_rss_mb); None otherwise.
+    """
+    name = None
+    last_usage = None
+
+    def segment(self, input_img, output_folder, task=DEFAULT_TASK, roi_subset=DEFAULT_ROI_SUBSET):
+        raise NotImplementedError
+
+    def version(self):
+        """String identifying the model/backend, used to key cached outputs."""
+        return f"{self.name}"
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class SubprocessBackend(SegmentationBackend):
+    """Run the TotalSegmentator CLI once per image (a new interpreter, imports and model every call)."""
+    name = "subprocess"
+
+    def __init__(self, executable="TotalSegmentator", extra_args=(), env=None):
+        self.executable = executable
+        self.extra_args = list(extra_args)
+        self.env = env
+
+    def segment(self, input_img, output_folder, task=DEFAULT_TASK, roi_subset=DEFAULT_ROI_SUBSET):
+        cmd = [
+            self.executable,
+            "-i", input_img,
+            "-o", output_folder,
+            "--task", task,
+            "--roi_subset", *roi_subset
+        ] + self.extra_args
+        self.last_usage = None
+        proc = subprocess.Popen(cmd, env=self.env, stdout=_output_fd(sys.stdout), stderr=_output_fd(sys.stderr))
+        try:
+            # wait4 gives the usage of this child only, even with other segmentations running
+            _, status, usage = os.wait4(proc.pid, 0)
+        except BaseException:
+            proc.kill()
+            proc.wait()
+            raise
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        peak = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+        self.last_usage = {"child_cpu_user_s": usage.ru_utime, "child_cpu_sys_s": usage.ru_stime,
+                           "child_peak_rss_mb": peak / 2 ** 20}
+        if proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, cmd)
+
+    def version(self):
+        return f"{self.name}:{totalsegmentator_version()}"
+
+def load_totalsegmentator(**options):
+    """
+    Import TotalSegmentator once and return a callable segmenting one image.
+    Runs inside the worker process. Only the interpreter, the imports and the
+    torch / CUDA setup are reused across images: the python API builds a new
+    nnU-Net predictor, and so reloads the weights, on every call.
+    """
+    from totalsegmentator.python_api import totalsegmentator
+
+    def run(input_img, output_folder, task, roi_subset):
+        totalsegmentator(input_img, output_folder, task=task, roi_subset=list(roi_subset), **options)
+    return run
+
+def _worker_loop(factory, options, requests, responses):
+    """Call factory once, then serve segmentation requests until None is received."""
+    try:
+        run = factory(**options)
+    except Exception as e:
+        responses.put((None, f"{type(e).__name__}: {e}"))
+        return
+    responses.put((None, None))  # ready
+
+    for job in iter(requests.get, None):
+        job_id, input_img, output_folder, task, roi_subset = job
+        try:
+            run(input_img, output_folder, task, roi_subset)
+            responses.put((job_id, None))
+        except Exception as e:
+            responses.put((job_id, f"{type(e).__name__}: {e}"))
+
+class WorkerBackend(SegmentationBackend):
+    """
+    Keep one long-lived process and send it images over a queue.
+    factory(**options) is called once in the worker and must return
+    run(input_img, output_folder, task, roi_subset); whatever it sets up is
+    reused by every job (for TotalSegmentator, the imports and framework
+    setup but not the model weights, see load_totalsegmentator).
+    """
+    name = "worker"
+
+    def __init__(self, factory=load_totalsegmentator, **options):
+        ctx = mp.get_context("spawn")
+        self._requests = ctx.Queue()
+        self._responses = ctx.Queue()
+        self._process = ctx.Process(target=_worker_loop, args=(factory, options, self._requests, self._responses), daemon=True)
+        self._process.start()
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._dead = False
+
+        _, error = self._response()
+        if error is not None:
+            self._process.join()
+            raise RuntimeError(f"Segmentation worker failed to start: {error}")
+
+    def segment(self, input_img, output_folder, task=DEFAULT_TASK, roi_subset=DEFAULT_ROI_SUBSET):
+        with self._lock:
+            if self._dead or not self._process.is_alive():
+                self._dead = True
+                raise RuntimeError("Segmentation worker is not running.")
+            self._next_id += 1
+            self.last_usage = None
+            _reset_peak_rss(self._process.pid)
+            start = _proc_usage(self._process.pid)
+            self._requests.put((self._next_id, os.path.abspath(input_img), os.path.abspath(output_folder), task, tuple(roi_subset)))
+            job_id, error = self._response()
+            # One job at a time per worker, so the difference is this job's usage
+            end = _proc_usage(self._process.pid)
+            if start is not None and end is not None:
+                self.last_usage = {"child_cpu_user_s": end[0] - start[0], "child_cpu_sys_s": end[1] - start[1],
+                                   "child_peak_rss_mb": end[2] / 2 ** 20}
+        if error is not None:
+            raise RuntimeError(f"Segmentation of {input_img} failed: {error}")
+
+    def _response(self):
+        # Wait for the worker's answer, but give up if it dies (e.g. killed for running out of memory)
+        while True:
+            try:
+                return self._responses.get(timeout=WORKER_POLL_INTERVAL)
+            except queue.Empty:
+                if not self._process.is_alive():
+                    self._dead = True
+                    raise RuntimeError(f"Segmentation worker died (exit code {self._process.exitcode}).") from None
+
+    def version(self):
+        return f"{self.name}:{totalsegmentator_version()}"
+
+    def close(self):
+        if not self._dead and self._process.is_alive():
+            self._requests.put(None)
+            self._process.join()
+
+class StandInBackend(SegmentationBackend):
+    """
+    Local replacement for the model, for tests and benchmarks.
+    With mask_source, copies a precomputed mask: either a single file, or a folder
+    holding <image base name>.nii.gz per image. Without it, thresholds the image.
+    """
+    name = "stand-in"
+
+    def __init__(self, mask_source=None, threshold_percentile=99.0):
+        self.mask_source = mask_source
+        self.threshold_percentile = threshold_percentile
+
+    def segment(self, input_img, output_folder, task=DEFAULT_TASK, roi_subset=DEFAULT_ROI_SUBSET):
+        os.makedirs(output_folder, exist_ok=True)
+        for roi in roi_subset:
+            out_path = os.path.join(output_folder, f"{roi}.nii.gz")
+            if self.mask_source is None:
+                self._threshold(input_img, out_path)
+            elif os.path.isdir(self.mask_source):
+                base = os.path.basename(input_img).split(".")[0]
+                shutil.copyfile(os.path.join(self.mask_source, base + ".nii.gz"), out_path)
+            else:
+                shutil.copyfile(self.mask_source, out_path)
+
+    def _threshold(self, input_img, out_path):
+        import numpy as np
+        import SimpleITK as sitk
+
+        img = sitk.ReadImage(input_img)
+        arr = sitk.GetArrayViewFromImage(img)
+        mask = (arr > np.percentile(arr, self.threshold_percentile)).astype(np.uint8)
+        mask_img = sitk.GetImageFromArray(mask)
+        mask_img.CopyInformation(img)
+        sitk.WriteImage(mask_img, out_path)
+
+    def version(self):
+        return f"{self.name}:{self.mask_source or self.threshold_percentile}"
+
+BACKENDS = {
+    SubprocessBackend.name: SubprocessBackend,
+    WorkerBackend.name: WorkerBackend,
+    StandInBackend.name: StandInBackend,
+}
+
+def get_backend(name, **kwargs):
+    """Instantiate a segmentation backend by name."""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown segmentation backend '{name}'. Choose from: {', '.join(BACKENDS)}")
+    return BACKENDS[name](**kwargs)
@@ -0,0 +1,204 @@
+import argparse
+import contextlib
+import csv
+import json
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from spine_eval.utils.threads import add_thread_arguments, per_worker_threads, set_thread_budget
+
+# Columns every manifest row must provide
+MANIFEST_FIELDS = ["image", "ground_truth", "work_dir"]
+# Columns written back by the batch runner
+STATUS_FIELDS = ["status", "error"]
+
+STATUS_PENDING = "pending"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+# Segmentation backend and cache of the current worker process, created once by _init_worker
+_backend = None
+_cache = None
+_trace = False
+_incremental = False
+_results_db = None
+
+def _init_worker(backend_name, backend_kwargs, cache_dir=None, cache_max_bytes=None, trace=False, incremental=False,
+                 results_db=None, threads=None):
+    global _backend, _cache, _trace, _incremental, _results_db
+    if threads is not None:
+        # Before any library (or the segmentation backend) starts its thread pools
+        set_thread_budget(threads)
+    _trace = trace
+    _incremental = incremental
+    _results_db = results_db
+    from spine_eval.main.backends import get_backend
+    from spine_eval.main.cache import SegmentationCache
+    _backend = get_backend(backend_name, **backend_kwargs)
+    if cache_dir is not None:
+        _cache = SegmentationCache(cache_dir, cache_max_bytes)
+
+def load_manifest(manifest_path):
+    """
+    Load a cohort manifest (.csv or .json) as a list of dicts.
+    A JSON manifest is a list of objects with the same keys as the CSV columns.
+    """
+    if manifest_path.endswith(".json"):
+        with open(manifest_path) as f:
+            entries = json.load(f)
+    else:
+        with open(manifest_path, newline='') as f:
+            entries = list(csv.DictReader(f))
+
+    for i, entry in enumerate(entries):
+        missing = [k for k in MANIFEST_FIELDS if not entry.get(k)]
+        if missing:
+            raise ValueError(f"Manifest row {i} is missing {', '.join(missing)}")
+        entry.setdefault("status", STATUS_PENDING)
+        entry["status"] = entry["status"] or STATUS_PENDING
+        entry.setdefault("error", "")
+    return entries
+
+def save_manifest(manifest_path, entries):
+    """
+    Write the manifest atomically so an interrupted run never leaves it truncated.
+    """
+    tmp_path = manifest_path + ".tmp"
+    if manifest_path.endswith(".json"):
+        with open(tmp_path, 'w') as f:
+            json.dump(entries, f, indent=2)
+    else:
+        fields = list(MANIFEST_FIELDS)
+        for entry in entries:
+            fields += [k for k in entry if k not in fields and k not in STATUS_FIELDS]
+        fields += STATUS_FIELDS
+        with open(tmp_path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(entries)
+    os.replace(tmp_path, manifest_path)
+
+def run_subject(entry):
+    """
+    Run the pipeline for one manifest entry inside a worker process.
+    Output of the subject is redirected to <work_dir>/pipeline.log.
+    """
+    # Imported here so that the parent process stays light
+    from spine_eval.main.TS_pipeline import run_pipeline, run_pipeline_incremental, TRACE_NAME
+    from spine_eval.main.instrument import Tracer
+
+    os.makedirs(entry["work_dir"], exist_ok=True)
+    log_path = os.path.join(entry["work_dir"], "pipeline.log")
+    tracer = None
+    if _trace:
+        trace_path = os.path.join(entry["work_dir"], TRACE_NAME)
+        if os.path.exists(trace_path):
+            os.remove(trace_path)
+        tracer = Tracer(trace_path, subject=entry["image"])
+    with open(log_path, 'w') as log, contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            run = run_pipeline_incremental if _incremental else run_pipeline
+            run(entry["image"], entry["ground_truth"], entry["work_dir"], _backend, _cache, tracer, results_db=_results_db,
+                reorient=entry.get("reorient", False))
+        except Exception as e:
+            traceback.print_exc()
+            return STATUS_FAILED, f"{type(e).__name__}: {e}"
+    return STATUS_DONE, ""
+
+def run_batch(manifest_path, workers=1, subject_fn=run_subject, backend="subprocess", backend_kwargs=None,
+              cache_dir=None, cache_max_bytes=None, trace=False, incremental=False, results_db=None, threads=None,
+              preflight=None):
+    """
+    Run every subject of the manifest not yet marked as done, using a process pool.
+    Each pool process creates its segmentation backend once and reuses it.
+    The manifest is updated after each subject, so a rerun resumes where it stopped.
+    With trace, each subject writes <work_dir>/trace.jsonl and a per-stage summary
+    of all subjects is saved next to the manifest. With incremental, each
+    subject only reruns the stages whose inputs, parameters or code changed.
+    With results_db, all workers add their scores to that SQLite database.
+    threads is the total core budget split between the workers (see
+    utils.threads.per_worker_threads); it also bounds the segmentation subprocess.
+    preflight is a main.preflight report: subjects with errors are marked as
+    failed without running, and GT volumes it flags are reoriented.
+    """
+    entries = load_manifest(manifest_path)
+    # Incremental runs revisit every subject: up-to-date stages are skipped cheaply
+    todo = [i for i, e in enumerate(entries) if incremental or e["status"] != STATUS_DONE]
+    print(f"{len(entries) - len(todo)} subjects already done, {len(todo)} to run.")
+    options = apply_preflight(manifest_path, entries, todo, preflight)
+    worker_threads = per_worker_threads(threads, workers)
+    if worker_threads is not None:
+        print(f"{worker_threads} threads per worker.")
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(backend, backend_kwargs or {}, cache_dir, cache_max_bytes, trace, incremental, results_db, worker_threads)) as pool:
+        futures = {pool.submit(subject_fn, dict(entries[i], **options[i])): i for i in options}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                status, error = future.result()
+            except Exception as e:
+                # The worker itself died (e.g. killed by the OOM killer)
+                status, error = STATUS_FAILED, f"{type(e).__name__}: {e}"
+            entries[i]["status"] = status
+            entries[i]["error"] = error
+            save_manifest(manifest_path, entries)
+            print(f"[{status}] {entries[i]['image']}" + (f" ({error})" if error else ""))
+
+    failed = sum(e["status"] == STATUS_FAILED for e in entries)
+    print(f"Batch finished: {len(entries) - failed} done, {failed} failed.")
+
+    if trace:
+        save_trace_summary(manifest_path, entries)
+    return entries
+
+def apply_preflight(manifest_path, entries, todo, report_path=None):
+    """
+    Run options of the subjects to run, by manifest index. With a pre-flight
+    report, subjects it found errors for are marked as failed (and dropped).
+    """
+    if report_path is None:
+        return {i: {} for i in todo}
+    from spine_eval.main.preflight import plan_from_report
+    options, blocked = plan_from_report(entries, todo, report_path)
+    for i, error in blocked.items():
+        entries[i]["status"] = STATUS_FAILED
+        entries[i]["error"] = error
+        print(f"[{STATUS_FAILED}] {entries[i]['image']} ({error})")
+    if blocked:
+        save_manifest(manifest_path, entries)
+    return options
+
+def save_trace_summary(manifest_path, entries):
+    """Aggregate the per-subject traces of a manifest into <manifest>_trace_summary.json."""
+    from spine_eval.main.TS_pipeline import TRACE_NAME
+    from spine_eval.main.instrument import summarize_traces, print_summary
+    summary_path = os.path.splitext(manifest_path)[0] + "_trace_summary.json"
+    summary = summarize_traces([os.path.join(e["work_dir"], TRACE_NAME) for e in entries], summary_path)
+    print_summary(summary)
+    print(f"Saved trace summary to {summary_path}")
+    return summary
+
+def cli(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Run the TotalSegmentator pipeline over a cohort manifest.")
+    parser.add_argument("--manifest", type=str, required=True, help="CSV or JSON manifest with image, ground_truth and work_dir per subject")
+    parser.add_argument("--workers", type=int, default=1, help="Number of subjects processed concurrently")
+    parser.add_argument("--backend", type=str, default="subprocess", help="Segmentation backend (subprocess, worker, stand-in)")
+    parser.add_argument("--stand_in_mask", type=str, default=None, help="Mask file or folder used by the stand-in backend")
+    parser.add_argument("--cache_dir", type=str, default=None, help="Reuse segmentation outputs cached in this folder")
+    parser.add_argument("--cache_max_gb", type=float, default=None, help="Size limit of the cache (LRU eviction)")
+    parser.add_argument("--trace", action="store_true", help="Record per-stage traces and save an aggregated summary")
+    parser.add_argument("--results_db", type=str, default=None, help="Add every subject's scores to this SQLite results database")
+    parser.add_argument("--incremental", action="store_true", help="Revisit every subject, rerunning only stages whose inputs, parameters or code changed")
+    parser.add_argument("--preflight", type=str, default=None, help="Pre-flight report (main.preflight): skip subjects with errors, reorient flagged GT")
+    add_thread_arguments(parser)
+    args = parser.parse_args(argv)
+
+    backend_kwargs = {"mask_source": args.stand_in_mask} if args.backend == "stand-in" else {}
+    cache_max_bytes = int(args.cache_max_gb * 1e9) if args.cache_max_gb is not None else None
+    run_batch(args.manifest, args.workers, backend=args.backend, backend_kwargs=backend_kwargs,
+              cache_dir=args.cache_dir, cache_max_bytes=cache_max_bytes, trace=args.trace, incremental=args.incremental,
+              results_db=args.results_db, threads=args.threads, preflight=args.preflight)
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,147 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+
+from spine_eval.utils.hashing import hash_file
+
+META_NAME = "meta.json"
+
+def make_key(*parts):
+    """Combine hashes and parameters into one cache key."""
+    return hashlib.blake2b(json.dumps(parts, sort_keys=True).encode(), digest_size=20).hexdigest()
+
+def _dir_size(path):
+    size = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try:
+                size += os.path.getsize(os.path.join(root, f))
+            except FileNotFoundError:
+                # Evicted by another process while listing
+                pass
+    return size
+
+class SegmentationCache:
+    """
+    Content-addressed store of pipeline artifacts: one folder per key under root.
+    The modification time of each entry's meta.json records its last use and
+    drives LRU eviction once the cache grows over max_bytes. Entries are
+    written to a temporary folder and renamed, so concurrent runs never see
+    partial entries; an entry evicted by another process while it is listed
+    or fetched is skipped, or fetched as a miss.
+    """
+    def __init__(self, root, max_bytes=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def _entry_dir(self, key):
+        return os.path.join(self.root, key)
+
+    def fetch(self, key, dest_folder, names):
+        """Copy the cached files of key into dest_folder. Returns False on a miss."""
+        entry = self._entry_dir(key)
+        try:
+            # Marked as used first, so concurrent evictions take other entries
+            os.utime(os.path.join(entry, META_NAME))
+        except OSError:
+            return False
+        os.makedirs(dest_folder, exist_ok=True)
+        try:
+            for name in names:
+                shutil.copyfile(os.path.join(entry, name), os.path.join(dest_folder, name))
+        except FileNotFoundError:
+            # Evicted by another process during the copy: the caller recomputes the files
+            return False
+        return True
+
+    def store(self, key, src_folder, names, meta=None):
+        """Copy files from src_folder into the cache under key, then evict if needed."""
+        entry = self._entry_dir(key)
+        if os.path.exists(entry):
+            return
+        tmp = os.path.join(self.root, f".tmp-{uuid.uuid4().hex}")
+        os.makedirs(tmp)
+        for name in names:
+            shutil.copyfile(os.path.join(src_folder, name), os.path.join(tmp, name))
+        with open(os.path.join(tmp, META_NAME), 'w') as f:
+            json.dump({"files": list(names), "created": time.time(), **(meta or {})}, f, indent=2)
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            # Another process stored the same key first
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.evict()
+
+    def entries(self):
+        """List cache entries as dicts, most recently used first."""
+        result = []
+        for key in os.listdir(self.root):
+            meta_path = os.path.join(self.root, key, META_NAME)
+            if key.startswith("."):
+                continue
+            try:
+                with open(meta_path) as f:
+                    meta = json.load(f)
+                last_used = os.path.getmtime(meta_path)
+            except FileNotFoundError:
+                # Not an entry, or evicted by another process while listing
+                continue
+            meta.update(key=key, last_used=last_used, size=_dir_size(self._entry_dir(key)))
+            result.append(meta)
+        result.sort(key=lambda e: e["last_used"], reverse=True)
+        return result
+
+    def evict(self, max_bytes=None):
+        """Remove least recently used entries until the cache fits in max_bytes."""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        if max_bytes is None:
+            return []
+        entries = self.entries()
+        total = sum(e["size"] for e in entries)
+        removed = []
+        while entries and total > max_bytes:
+            entry = entries.pop()
+            shutil.rmtree(self._entry_dir(entry["key"]), ignore_errors=True)
+            total -= entry["size"]
+            removed.append(entry["key"])
+        return removed
+
+    def purge(self, older_than=None):
+        """Remove all entries, or only those unused for more than older_than seconds."""
+        now = time.time()
+        removed = []
+        for entry in self.entries():
+            if older_than is None or now - entry["last_used"] > older_than:
+                shutil.rmtree(self._entry_dir(entry["key"]), ignore_errors=True)
+                removed.append(entry["key"])
+        return removed
+
+def cli(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Inspect or purge the segmentation cache.")
+    parser.add_argument("--cache_dir", type=str, required=True, help="Cache folder")
+    parser.add_argument("--list", action="store_true", help="List cached entries")
+    parser.add_argument("--purge", action="store_true", help="Remove cached entries")
+    parser.add_argument("--older_than_days", type=float, default=None, help="With --purge, only remove entries unused for this many days")
+    parser.add_argument("--max_size_gb", type=float, default=None, help="Evict least recently used entries down to this size")
+    args = parser.parse_args(argv)
+
+    cache = SegmentationCache(args.cache_dir)
+    if args.purge:
+        older_than = args.older_than_days * 86400 if args.older_than_days is not None else None
+        print(f"Removed {len(cache.purge(older_than))} entries.")
+    if args.max_size_gb is not None:
+        print(f"Evicted {len(cache.evict(int(args.max_size_gb * 1e9)))} entries.")
+    if args.list or not (args.purge or args.max_size_gb is not None):
+        entries = cache.entries()
+        for e in entries:
+            used = time.strftime("%Y-%m-%d %H:%M", time.localtime(e["last_used"]))
+            print(f"{e['key']}  {e['size'] / 1e6:10.1f} MB  last used {used}  {e.get('image', '')}")
+        print(f"{len(entries)} entries, {sum(e['size'] for e in entries) / 1e6:.1f} MB total.")
+
+if __name__ == "__main__":
+    cli()
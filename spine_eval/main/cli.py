@@ -0,0 +1,53 @@
+import argparse
+import importlib
+import sys
+
+from spine_eval.utils.threads import core_budget, set_thread_budget
+
+# Subcommands: name -> (module, summary). Every module has a cli(argv, prog)
+# entry point (also used by its own `python -m` __main__). A module is only
+# imported when its subcommand runs, so `spine-eval --help` or a gzip check
+# never loads SimpleITK, nibabel or numpy.
+COMMANDS = {
+    "pipeline": ("spine_eval.main.TS_pipeline", "Segment, label and score one subject"),
+    "batch": ("spine_eval.main.batch", "Run the pipeline over a cohort manifest"),
+    "schedule": ("spine_eval.main.scheduler", "Run a cohort with per-resource concurrency limits"),
+    "preflight": ("spine_eval.main.preflight", "Check a cohort's images and GT files from their headers"),
+    "dice-ts": ("spine_eval.dice_score.ds_ts", "Dice of a TotalSegmentator prediction"),
+    "dice-spineps": ("spine_eval.dice_score.ds_spineps", "Dice of a SPINEPS prediction"),
+    "dice-multi": ("spine_eval.dice_score.multi", "Dice of several predictions against one GT folder"),
+    "results": ("spine_eval.dice_score.results_db", "Query, import or export the results database"),
+    "separate": ("spine_eval.utils.separate", "Label discs between consecutive vertebrae (anatomical order)"),
+    "separate-sacrum": ("spine_eval.utils.separate_if_sacrum", "Label discs bottom to top (full lumbar column)"),
+    "label-vertebrae": ("spine_eval.utils.label_w_vertebrae", "Label discs between vertebrae sorted by height"),
+    "gzip-check": ("spine_eval.utils.gzip_check", "Check (and fix) .nii.gz files"),
+    "mha2nifti": ("spine_eval.utils.mha2nifti", "Convert .mha images to NIfTI"),
+    "cache": ("spine_eval.main.cache", "Inspect or purge the segmentation cache"),
+    "dag": ("spine_eval.main.dag", "Show or reset the stage fingerprints of a work dir"),
+    "trace": ("spine_eval.main.instrument", "Summarize per-stage pipeline traces"),
+}
+
+PROG = "spine-eval"
+
+def build_parser():
+    commands = "\n".join(f"  {name:16s} {summary}" for name, (_, summary) in COMMANDS.items())
+    parser = argparse.ArgumentParser(prog=PROG, description="Spine segmentation pipeline and evaluation tools.",
+                                     epilog=f"commands:\n{commands}\n\nRun '{PROG} <command> --help' for the options of a command.",
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=list(COMMANDS), metavar="command", help="One of the commands below")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="Options of the command")
+    return parser
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    # Parse only the command name here; its options are parsed by the module
+    args = build_parser().parse_args(argv[:1])
+    # $SPINE_EVAL_THREADS bounds every tool, set before the tool imports SimpleITK or NumPy
+    budget = core_budget()
+    if budget is not None:
+        set_thread_budget(budget)
+    module = importlib.import_module(COMMANDS[args.command][0])
+    module.cli(argv[1:], prog=f"{PROG} {args.command}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+import argparse
+import json
+import os
+import time
+
+from spine_eval.main.cache import make_key
+from spine_eval.main.instrument import NULL_TRACER
+from spine_eval.utils.hashing import hash_file
+
+# Per-work-dir record of the fingerprint of every stage that ran
+STATE_NAME = ".pipeline_state.json"
+
+class Stage:
+    """
+    One step of a pipeline DAG.
+    fn:       called as fn(*args) to produce the outputs; stages using the
+              "segment" resource get the segmentation backend as the backend
+              keyword argument
+    inputs:   files (or folders, hashed file by file) the stage reads
+    outputs:  files the stage writes; a stage whose input is another stage's
+              output runs after it
+    params:   JSON-serializable parameters that change the result
+    code:     modules (or source files) whose content is part of the fingerprint,
+              so editing the implementation reruns the stage
+    resource: resource class the stage needs ("io", "cpu" or "segment", see
+              main.scheduler); with module-level fn and picklable args, the
+              stage can run in a worker process
+    """
+    def __init__(self, name, fn, inputs=(), outputs=(), params=None, code=(), args=(), resource="cpu"):
+        self.name = name
+        self.fn = fn
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.params = params or {}
+        self.code = [getattr(c, "__file__", c) for c in code]
+        self.args = tuple(args)
+        self.resource = resource
+
+    def __call__(self, backend=None):
+        if self.resource == "segment":
+            return self.fn(*self.args, backend=backend)
+        return self.fn(*self.args)
+
+class StageGraph:
+    """
+    A small DAG of stages sharing one state file. A stage reruns only when its
+    fingerprint (name, parameters, code and input file contents) differs from
+    the recorded one, or when one of its outputs is missing or was modified.
+    Content hashes are memoized on file size and modification time, so an
+    unchanged cohort is checked without rereading any volume.
+    """
+    def __init__(self, state_path):
+        self.state_path = state_path
+        self.stages = []
+        self.state = {"stages": {}, "files": {}}
+        if os.path.exists(state_path):
+            try:
+                with open(state_path) as f:
+                    self.state = json.load(f)
+            except (OSError, ValueError):
+                pass
+
+    def add(self, stage):
+        if any(s.name == stage.name for s in self.stages):
+            raise ValueError(f"Duplicate stage name: {stage.name}")
+        self.stages.append(stage)
+        return stage
+
+    def order(self):
+        """Stages in dependency order (a stage after the producers of its inputs)."""
+        producers = {os.path.abspath(o): s for s in self.stages for o in s.outputs}
+        ordered, visiting = [], set()
+
+        def visit(stage):
+            if stage in ordered:
+                return
+            if stage.name in visiting:
+                raise ValueError(f"Cycle in pipeline stages at {stage.name}")
+            visiting.add(stage.name)
+            for path in stage.inputs:
+                producer = producers.get(os.path.abspath(path))
+                if producer is not None and producer is not stage:
+                    visit(producer)
+            visiting.discard(stage.name)
+            ordered.append(stage)
+
+        for stage in self.stages:
+            visit(stage)
+        return ordered
+
+    def _file_hash(self, path):
+        st = os.stat(path)
+        signature = [st.st_size, st.st_mtime_ns]
+        entry = self.state["files"].get(path)
+        if entry is None or entry["signature"] != signature:
+            entry = {"signature": signature, "hash": hash_file(path)}
+            self.state["files"][path] = entry
+        return entry["hash"]
+
+    def _path_hash(self, path):
+        path = os.path.abspath(path)
+        if os.path.isdir(path):
+            names = sorted(f for f in os.listdir(path) if not f.startswith("."))
+            return make_key([[name, self._path_hash(os.path.join(path, name))] for name in names])
+        if not os.path.exists(path):
+            return None
+        return self._file_hash(path)
+
+    def fingerprint(self, stage):
+        inputs = {path: self._path_hash(path) for path in stage.inputs}
+        missing = [path for path, h in inputs.items() if h is None]
+        if missing:
+            raise FileNotFoundError(f"Stage '{stage.name}' is missing inputs: {', '.join(missing)}")
+        code = {os.path.basename(path): self._file_hash(path) for path in stage.code}
+        return make_key(stage.name, stage.params, inputs, code)
+
+    def _outputs_unchanged(self, stage, record):
+        recorded = record.get("outputs", {})
+        return all(path in recorded and os.path.exists(path) and self._path_hash(path) == recorded[path]
+                   for path in stage.outputs)
+
+    def is_up_to_date(self, stage):
+        record = self.state["stages"].get(stage.name)
+        return (record is not None and record["fingerprint"] == self.fingerprint(stage)
+                and self._outputs_unchanged(stage, record))
+
+    def steps(self, force=()):
+        """
+        Generator of the stages that are out of date, in dependency order.
+        force: names of stages to rerun regardless of their fingerprint
+        (the stages depending on them rerun because their inputs change).
+        The caller runs each yielded stage; it is recorded as done when the
+        next one is requested, so the fingerprint of the following stages
+        sees its outputs. The generator returns a dict stage name -> "ran" or
+        "skipped".
+        """
+        results = {}
+        for stage in self.order():
+            if stage.name not in force and self.is_up_to_date(stage):
+                print(f"[{stage.name}] up to date, skipped.")
+                results[stage.name] = "skipped"
+                continue
+
+            yield stage
+            # Recompute the fingerprint: a stage may rewrite its own inputs (e.g. gzip repair)
+            self.state["stages"][stage.name] = {
+                "fingerprint": self.fingerprint(stage),
+                "outputs": {path: self._path_hash(path) for path in stage.outputs},
+                "finished": time.time(),
+            }
+            self.save()
+            results[stage.name] = "ran"
+        return results
+
+    def run(self, force=(), tracer=None, backend=None):
+        """
+        Run the stages that are out of date, in dependency order (see steps).
+        backend is passed to the stages using the "segment" resource.
+        Returns a dict stage name -> "ran" or "skipped".
+        """
+        tracer = tracer or NULL_TRACER
+        steps = self.steps(force)
+        try:
+            stage = next(steps)
+            while True:
+                with tracer.stage(stage.name):
+                    stage(backend)
+                stage = next(steps)
+        except StopIteration as stop:
+            return stop.value
+
+    def invalidate(self, names=None):
+        """Forget the records of the given stages (all by default)."""
+        for name in list(self.state["stages"]) if names is None else names:
+            self.state["stages"].pop(name, None)
+        self.save()
+
+    def save(self):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+def cli(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Show or reset the recorded stage fingerprints of a pipeline work dir.")
+    parser.add_argument("--work_dir", type=str, required=True, help="Subject work dir")
+    parser.add_argument("--invalidate", type=str, nargs="*", default=None, help="Forget these stages (all if none given)")
+    args = parser.parse_args(argv)
+
+    graph = StageGraph(os.path.join(args.work_dir, STATE_NAME))
+    if args.invalidate is not None:
+        graph.invalidate(args.invalidate or None)
+    for name, record in graph.state["stages"].items():
+        finished = time.strftime("%Y-%m-%d %H:%M", time.localtime(record["finished"]))
+        print(f"{name:12s} {record['fingerprint'][:12]}  {finished}")
+
+if __name__ == "__main__":
+    cli()
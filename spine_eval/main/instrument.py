@@ -0,0 +1,191 @@
+import argparse
+import contextlib
+import functools
+import json
+import os
+import resource
+import statistics
+import sys
+import threading
+import time
+
+from spine_eval.utils.threads import thread_settings
+
+def peak_rss_bytes(who=resource.RUSAGE_SELF):
+    """Peak resident set size (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    rss = resource.getrusage(who).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+def _reset_peak_rss():
+    """Reset the kernel's peak RSS counter (Linux only), so each stage reports its own peak."""
+    try:
+        with open("/proc/self/clear_refs", 'w') as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def _current_peak_rss():
+    """Peak RSS since the last reset (VmHWM), falling back to the lifetime peak."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return peak_rss_bytes()
+
+def _io_counters():
+    """Bytes read/written by this process (Linux /proc/self/io), else block counts."""
+    try:
+        with open("/proc/self/io") as f:
+            fields = dict(line.split(": ") for line in f.read().splitlines())
+        return int(fields["rchar"]), int(fields["wchar"])
+    except (OSError, KeyError, ValueError):
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return usage.ru_inblock * 512, usage.ru_oublock * 512
+
+class Tracer:
+    """
+    Records wall time, CPU time (own and of child processes), peak RSS,
+    bytes read/written and thread counts per pipeline stage, as JSON lines in
+    trace_path. The counters are process-wide: stages run concurrently in
+    threads of one process (e.g. several segmentations in main.scheduler)
+    see each other's usage, unless they set the fields themselves. The peak
+    RSS of a child process (child_peak_rss_mb) is only known per process, so
+    it is recorded only by stages that set it from their own child (see
+    main.backends.SegmentationBackend.last_usage).
+    A disabled tracer does nothing but yield, so it can always be passed around.
+    """
+    def __init__(self, trace_path=None, subject=None, enabled=True):
+        self.trace_path = trace_path
+        self.subject = subject
+        self.enabled = enabled
+        self.records = []
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name, **fields):
+        """Context manager measuring one stage; extra fields can be added to the yielded dict."""
+        if not self.enabled:
+            yield {}
+            return
+
+        record = {"subject": self.subject, "stage": name, **fields}
+        _reset_peak_rss()
+        self_start = resource.getrusage(resource.RUSAGE_SELF)
+        child_start = resource.getrusage(resource.RUSAGE_CHILDREN)
+        read_start, write_start = _io_counters()
+        record["start"] = time.time()
+        wall_start = time.perf_counter()
+        status = "ok"
+        try:
+            yield record
+        except BaseException as e:
+            status = f"error: {type(e).__name__}"
+            raise
+        finally:
+            wall = time.perf_counter() - wall_start
+            self_end = resource.getrusage(resource.RUSAGE_SELF)
+            child_end = resource.getrusage(resource.RUSAGE_CHILDREN)
+            read_end, write_end = _io_counters()
+            record.update(status=status, wall_s=wall)
+            measured = dict(
+                cpu_user_s=self_end.ru_utime - self_start.ru_utime,
+                cpu_sys_s=self_end.ru_stime - self_start.ru_stime,
+                child_cpu_user_s=child_end.ru_utime - child_start.ru_utime,
+                child_cpu_sys_s=child_end.ru_stime - child_start.ru_stime,
+                peak_rss_mb=_current_peak_rss() / 2 ** 20,
+                read_bytes=read_end - read_start,
+                write_bytes=write_end - write_start,
+            )
+            # Values set by the stage itself (e.g. the usage of its own child
+            # process, see main.backends) take precedence over process-wide ones
+            for key, value in measured.items():
+                record.setdefault(key, value)
+            # Thread counts in effect (read at the end, once the stage imported SimpleITK)
+            for key, value in thread_settings().items():
+                record.setdefault(key, value)
+            self._write(record)
+
+    def trace(self, name=None):
+        """Decorator form of stage()."""
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.stage(name or fn.__name__):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _write(self, record):
+        with self._lock:
+            self.records.append(record)
+            if self.trace_path is not None:
+                with open(self.trace_path, 'a') as f:
+                    f.write(json.dumps(record) + "\n")
+
+# Shared no-op tracer used when tracing is off
+NULL_TRACER = Tracer(enabled=False)
+
+def read_trace(trace_path):
+    with open(trace_path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def summarize(records):
+    """
+    Aggregate stage records (e.g. from many subjects) into per-stage statistics:
+    count, total/mean/median/max wall time, total CPU time and max peak RSS.
+    """
+    by_stage = {}
+    for r in records:
+        by_stage.setdefault(r["stage"], []).append(r)
+
+    summary = {}
+    for stage, rs in by_stage.items():
+        walls = [r["wall_s"] for r in rs]
+        summary[stage] = {
+            "count": len(rs),
+            "errors": sum(r["status"] != "ok" for r in rs),
+            "wall_s_total": sum(walls),
+            "wall_s_mean": statistics.mean(walls),
+            "wall_s_median": statistics.median(walls),
+            "wall_s_max": max(walls),
+            "cpu_s_total": sum(r["cpu_user_s"] + r["cpu_sys_s"] + r["child_cpu_user_s"] + r["child_cpu_sys_s"] for r in rs),
+            "peak_rss_mb_max": max(r["peak_rss_mb"] for r in rs),
+            "read_bytes_total": sum(r["read_bytes"] for r in rs),
+            "write_bytes_total": sum(r["write_bytes"] for r in rs),
+            "threads": sorted({r["threads"] for r in rs if r.get("threads") is not None}),
+        }
+    return summary
+
+def summarize_traces(trace_paths, output_path=None):
+    """Aggregate several per-subject traces and optionally save the summary as JSON."""
+    records = []
+    for path in trace_paths:
+        if os.path.exists(path):
+            records += read_trace(path)
+    summary = summarize(records)
+    if output_path is not None:
+        with open(output_path, 'w') as f:
+            json.dump(summary, f, indent=2)
+    return summary
+
+def print_summary(summary):
+    print(f"{'stage':12s} {'n':>5s} {'total s':>10s} {'mean s':>9s} {'median s':>9s} {'max s':>9s} {'peak MB':>9s} {'threads':>8s}")
+    for stage, s in summary.items():
+        threads = ",".join(str(t) for t in s.get("threads", [])) or "-"
+        print(f"{stage:12s} {s['count']:5d} {s['wall_s_total']:10.2f} {s['wall_s_mean']:9.2f} "
+              f"{s['wall_s_median']:9.2f} {s['wall_s_max']:9.2f} {s['peak_rss_mb_max']:9.1f} {threads:>8s}")
+
+def cli(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Summarize per-stage pipeline traces (JSON lines).")
+    parser.add_argument("traces", type=str, nargs="+", help="trace.jsonl files")
+    parser.add_argument("--output", type=str, default=None, help="Save the summary as JSON")
+    args = parser.parse_args(argv)
+
+    print_summary(summarize_traces(args.traces, args.output))
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,286 @@
+import argparse
+import gzip
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import nibabel as nib
+import numpy as np
+from nibabel.spatialimages import HeaderDataError
+
+from spine_eval.main.batch import load_manifest
+from spine_eval.main.TS_pipeline import LABEL_MAPPING, subject_paths
+from spine_eval.utils.gzip_check import sniff_gzip
+from spine_eval.utils.volume import crop_extent
+
+# Issue levels: a subject with an error is skipped by batch / scheduler runs
+# given the report, warnings are only reported
+ERROR = "error"
+WARNING = "warning"
+OK = "ok"
+
+# Largest difference (mm) between spacings or affine entries of the same grid
+DEFAULT_ATOL = 1e-3
+
+# MetaImage stores LPS coordinates, NIfTI affines are RAS
+_LPS_TO_RAS = np.diag([-1.0, -1.0, 1.0, 1.0])
+
+def _nifti_header(path):
+    """
+    NIfTI header parsed from the first bytes of the (decompressed) file. A
+    .gz file that is not actually gzipped is read as plain NIfTI.
+    """
+    opener = gzip.open if path.endswith(".gz") and sniff_gzip(path) else open
+    with opener(path, 'rb') as f:
+        try:
+            return nib.Nifti1Header.from_fileobj(f)
+        except HeaderDataError:
+            pass
+    # NIfTI-2 and other formats nibabel knows
+    return nib.load(path).header
+
+def read_header(path):
+    """
+    Geometry of a NIfTI (.nii, .nii.gz) or MetaImage (.mha, .mhd) file, read
+    from its header only (no voxel data is decompressed): shape, spacing,
+    RAS affine and orientation axis codes. Cropped label maps report the
+    full grid they expand to. "gzip_ok" is False for a .gz file that is not
+    gzip compressed (the pipeline recompresses it, see utils.gzip_check).
+    """
+    if path.endswith((".mha", ".mhd")):
+        import SimpleITK as sitk
+        reader = sitk.ImageFileReader()
+        reader.SetFileName(path)
+        reader.ReadImageInformation()
+        shape = reader.GetSize()
+        spacing = reader.GetSpacing()
+        dim = len(shape)
+        affine = np.eye(4)
+        if dim == 3:
+            affine[:3, :3] = np.reshape(reader.GetDirection(), (3, 3)) * np.asarray(spacing)
+            affine[:3, 3] = reader.GetOrigin()
+            affine = _LPS_TO_RAS @ affine
+    else:
+        header = _nifti_header(path)
+        shape = header.get_data_shape()
+        spacing = header.get_zooms()
+        affine = header.get_best_affine()
+        extent = crop_extent(header.get("descrip", b""))
+        if extent is not None:
+            # Cropped label map (utils.label_io): report the full grid it expands to
+            offset, shape = extent
+            affine = affine.copy()
+            affine[:3, 3] -= affine[:3, :3] @ np.asarray(offset, dtype=float)
+    return {
+        "shape": [int(n) for n in shape],
+        "spacing": [float(s) for s in spacing],
+        "axcodes": "".join(nib.aff2axcodes(affine)),
+        "affine": np.asarray(affine, dtype=float).tolist(),
+        "gzip_ok": not path.endswith(".gz") or sniff_gzip(path),
+    }
+
+def reoriented(header, reference):
+    """
+    Shape and affine of header's volume once flipped / transposed to the
+    orientation of reference (as done by utils.volume.load_label_volume(like=...)).
+    """
+    affine = np.asarray(header["affine"])
+    ornt = nib.orientations.ornt_transform(nib.io_orientation(affine), nib.io_orientation(np.asarray(reference["affine"])))
+    shape = [0] * len(header["shape"])
+    for axis, (target, _) in enumerate(ornt):
+        shape[int(target)] = header["shape"][axis]
+    return shape, affine @ nib.orientations.inv_ornt_aff(ornt, header["shape"])
+
+def compare_geometry(header, reference, atol=DEFAULT_ATOL):
+    """
+    (level, check, message) describing how a volume's grid differs from the
+    reference grid, or None when they match. An orientation difference that a
+    flip / transpose fixes is a warning with check "orientation".
+    """
+    if len(header["shape"]) != 3:
+        return ERROR, "dimensions", f"expected a 3D volume, got shape {header['shape']}"
+    if header["axcodes"] != reference["axcodes"]:
+        shape, affine = reoriented(header, reference)
+        if shape == reference["shape"] and np.allclose(affine, reference["affine"], atol=atol):
+            return WARNING, "orientation", f"orientation {header['axcodes']} vs {reference['axcodes']}, fixed by reorienting"
+        return ERROR, "orientation", f"orientation {header['axcodes']} vs {reference['axcodes']} and the grids differ"
+    if header["shape"] != reference["shape"]:
+        return ERROR, "shape", f"shape {header['shape']} vs {reference['shape']}"
+    if not np.allclose(header["spacing"][:3], reference["spacing"][:3], atol=atol):
+        return ERROR, "spacing", f"spacing {header['spacing']} vs {reference['spacing']}"
+    if not np.allclose(header["affine"], reference["affine"], atol=atol):
+        return ERROR, "affine", "same shape and spacing but the voxel grids are not aligned (origin or direction)"
+    return None
+
+def check_subject(entry, label_mapping=LABEL_MAPPING, atol=DEFAULT_ATOL):
+    """
+    Pre-flight check of one manifest entry from headers only: the image is
+    readable, every label of the mapping has a GT file, and every GT file (and
+    an existing prediction) is on the image's voxel grid.
+    """
+    issues = []
+    def issue(level, check, message, path=None):
+        issues.append({"level": level, "check": check, "file": path, "message": message})
+
+    image, gt_folder = entry["image"], entry["ground_truth"]
+    result = {"image": image, "ground_truth": gt_folder, "work_dir": os.path.abspath(entry["work_dir"]),
+              "header": None, "issues": issues, "reorient": False}
+
+    try:
+        result["header"] = reference = read_header(image)
+    except Exception as e:
+        reference = None
+        issue(ERROR, "image", f"cannot read image header: {type(e).__name__}: {e}", image)
+    if reference is not None and not reference["gzip_ok"]:
+        issue(WARNING, "gzip", "not gzip compressed despite its .gz name, will be recompressed", image)
+    if reference is not None and len(reference["shape"]) != 3:
+        issue(ERROR, "dimensions", f"expected a 3D image, got shape {reference['shape']}", image)
+        reference = None
+
+    gt_files = {}
+    if not os.path.isdir(gt_folder):
+        issue(ERROR, "ground_truth", "ground truth folder not found", gt_folder)
+    else:
+        for f in sorted(os.listdir(gt_folder)):
+            if f.endswith(".nii.gz"):
+                gt_files[f[:-len(".nii.gz")]] = os.path.join(gt_folder, f)
+        missing = [name for name in label_mapping if name not in gt_files]
+        if len(missing) == len(label_mapping):
+            issue(ERROR, "labels", "no GT file matches the label mapping", gt_folder)
+        elif missing:
+            issue(WARNING, "labels", f"no GT file for {', '.join(missing)}", gt_folder)
+        unmapped = [name for name in gt_files if name not in label_mapping]
+        if unmapped:
+            issue(WARNING, "labels", f"GT files without a label in the mapping (not scored): {', '.join(unmapped)}", gt_folder)
+
+    # The prediction of an earlier run, checked when present
+    prediction = subject_paths(entry["work_dir"])["labeled_discs_path"]
+    to_compare = [(path, "ground_truth") for name, path in gt_files.items() if name in label_mapping]
+    if os.path.exists(prediction):
+        to_compare.append((prediction, "prediction"))
+
+    for path, role in to_compare:
+        try:
+            header = read_header(path)
+        except Exception as e:
+            issue(ERROR, role, f"cannot read header: {type(e).__name__}: {e}", path)
+            continue
+        if not header["gzip_ok"]:
+            if role == "ground_truth":
+                # Only the image is recompressed by the pipeline; nibabel cannot read this file
+                issue(ERROR, "gzip", "not gzip compressed despite its .gz name, cannot be scored (repair with gzip-check --fix)", path)
+            else:
+                issue(WARNING, "gzip", "not gzip compressed despite its .gz name, rewritten by the next run", path)
+        if reference is None:
+            continue
+        found = compare_geometry(header, reference, atol)
+        if found is None:
+            continue
+        level, check, message = found
+        if role == "prediction" and level == ERROR:
+            # A stale output is rewritten by the next run
+            level, message = WARNING, f"existing prediction does not match the image ({message})"
+        if role == "ground_truth" and check == "orientation" and level == WARNING:
+            result["reorient"] = True
+        issue(level, check, message, path)
+
+    levels = {i["level"] for i in issues}
+    result["status"] = ERROR if ERROR in levels else WARNING if WARNING in levels else OK
+    return result
+
+def _check_entry(args):
+    return check_subject(*args)
+
+def preflight(manifest_path, label_mapping=LABEL_MAPPING, output_path=None, workers=None, use_processes=False,
+              atol=DEFAULT_ATOL):
+    """
+    Check every subject of a manifest from file headers, on a thread pool (or a
+    process pool with use_processes). Returns the report and writes it as
+    JSON to output_path if given.
+    """
+    entries = load_manifest(manifest_path)
+    start = time.perf_counter()
+    pool_cls = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    with pool_cls(max_workers=workers) as pool:
+        subjects = list(pool.map(_check_entry, [(e, label_mapping, atol) for e in entries], chunksize=16))
+
+    counts = {level: sum(s["status"] == level for s in subjects) for level in (OK, WARNING, ERROR)}
+    report = {
+        "manifest": os.path.abspath(manifest_path),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "seconds": time.perf_counter() - start,
+        "label_mapping": label_mapping,
+        "summary": dict(counts, subjects=len(subjects), reorient=sum(s["reorient"] for s in subjects)),
+        "subjects": subjects,
+    }
+    if output_path is not None:
+        tmp_path = output_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        os.replace(tmp_path, output_path)
+    return report
+
+def load_report(report_path):
+    """Subjects of a pre-flight report by absolute work dir."""
+    with open(report_path) as f:
+        return {s["work_dir"]: s for s in json.load(f)["subjects"]}
+
+def plan_from_report(entries, indices, report_path):
+    """
+    Use a pre-flight report to plan a batch run. Returns (options, blocked):
+    options maps each runnable manifest index to extra run options
+    ({"reorient": True} when the GT needs reorienting), blocked maps the
+    indices of subjects with errors to an error message. Subjects missing
+    from the report run unchanged.
+    """
+    report = load_report(report_path)
+    options, blocked = {}, {}
+    for i in indices:
+        subject = report.get(os.path.abspath(entries[i]["work_dir"]))
+        if subject is None:
+            options[i] = {}
+        elif subject["status"] == ERROR:
+            errors = [issue["message"] for issue in subject["issues"] if issue["level"] == ERROR]
+            blocked[i] = "preflight: " + "; ".join(errors)
+        else:
+            options[i] = {"reorient": True} if subject["reorient"] else {}
+    return options, blocked
+
+def print_report(report, verbose=False):
+    for s in report["subjects"]:
+        if s["status"] == OK and not verbose:
+            continue
+        print(f"[{s['status']}] {s['image']}")
+        for i in s["issues"]:
+            print(f"    {i['level']:7s} {i['check']:12s} {i['message']}" + (f" ({i['file']})" if i["file"] else ""))
+    summary = report["summary"]
+    print(f"{summary['subjects']} subjects checked in {report['seconds']:.2f} s: {summary[OK]} ok, "
+          f"{summary[WARNING]} with warnings ({summary['reorient']} to reorient), {summary[ERROR]} with errors.")
+
+def cli(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Check the images and GT files of a cohort manifest from their headers only.")
+    parser.add_argument("--manifest", type=str, required=True, help="CSV or JSON manifest with image, ground_truth and work_dir per subject")
+    parser.add_argument("--label_mapping", type=str, default=None, help="JSON file of GT name -> disc label (default: OSF mapping)")
+    parser.add_argument("--output", type=str, default=None, help="Save the report as JSON (default: <manifest>_preflight.json)")
+    parser.add_argument("--workers", type=int, default=None, help="Subjects checked in parallel")
+    parser.add_argument("--processes", action="store_true", help="Use a process pool instead of threads")
+    parser.add_argument("--atol", type=float, default=DEFAULT_ATOL, help="Tolerance (mm) when comparing spacings and affines")
+    parser.add_argument("--verbose", action="store_true", help="Also list subjects without issues")
+    args = parser.parse_args(argv)
+
+    if args.label_mapping:
+        from spine_eval.utils.vertebrae import load_label_map
+        label_mapping = load_label_map(args.label_mapping)
+    else:
+        label_mapping = LABEL_MAPPING
+    output = args.output or os.path.splitext(args.manifest)[0] + "_preflight.json"
+    report = preflight(args.manifest, label_mapping, output, args.workers, args.processes, args.atol)
+    print_report(report, args.verbose)
+    print(f"Saved report to {output}")
+    # Non-zero exit status when any subject would fail
+    if report["summary"][ERROR]:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,298 @@
+import argparse
+import asyncio
+import contextlib
+import multiprocessing as mp
+import os
+import sys
+import threading
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from spine_eval.main.batch import load_manifest, save_manifest, save_trace_summary, apply_preflight, STATUS_DONE, STATUS_FAILED
+from spine_eval.utils.threads import add_thread_arguments, per_worker_threads, set_thread_budget
+
+# Resource classes with their default concurrency limits:
+# - segment: TotalSegmentator, memory-heavy, one backend instance per slot
+# - cpu:     disc labeling and Dice, in worker processes
+# - io:      hashing, cache copies, .mha conversion and gzip checks, in worker processes
+DEFAULT_LIMITS = {
+    "segment": 1,
+    "cpu": os.cpu_count() or 1,
+    "io": 4,
+}
+
+class _ThreadOutput:
+    """
+    Stand-in for sys.stdout / sys.stderr that writes to a per-thread target
+    (see _thread_output), or to the original stream for every other thread.
+    contextlib.redirect_stdout swaps the stream for the whole process, so it
+    cannot separate segmentations running in concurrent threads.
+    """
+    def __init__(self, default):
+        self._default = default
+        self._local = threading.local()
+
+    def _target(self):
+        return getattr(self._local, "target", None) or self._default
+
+    def write(self, text):
+        return self._target().write(text)
+
+    def flush(self):
+        self._target().flush()
+
+    def fileno(self):
+        # Used by subprocess backends, so TotalSegmentator's own output goes to the same log
+        return self._target().fileno()
+
+    def __getattr__(self, name):
+        return getattr(self._target(), name)
+
+@contextlib.contextmanager
+def _thread_output(stream):
+    """Send this thread's prints (and child process output, see main.backends) to stream."""
+    targets = [s for s in (sys.stdout, sys.stderr) if isinstance(s, _ThreadOutput)]
+    for t in targets:
+        t._local.target = stream
+    try:
+        yield stream
+    finally:
+        for t in targets:
+            t._local.target = None
+
+def _run_stage(fn, args, stage, subject, log_path, trace_path):
+    """
+    Run one stage function in a worker process, appending its output to the
+    subject's log and its measurements to the subject's trace.
+    """
+    from spine_eval.main.instrument import Tracer, NULL_TRACER
+    tracer = Tracer(trace_path, subject=subject) if trace_path else NULL_TRACER
+    with open(log_path, 'a') as log, contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        with tracer.stage(stage):
+            return fn(*args)
+
+def _advance(steps, result):
+    # Next stage of a steps generator, or (None, its return value); StopIteration cannot cross an executor
+    try:
+        return steps.send(result), None
+    except StopIteration as stop:
+        return None, stop.value
+
+class PipelineScheduler:
+    """
+    Runs the TS_pipeline stages of many subjects concurrently on one event loop.
+    Each resource class has its own semaphore, so a few memory-heavy
+    segmentations run next to many light post-processing jobs, and each
+    subject moves to its next stage as soon as the previous one is done.
+    The stages are those of main.TS_pipeline.pipeline_steps, or with
+    incremental of main.TS_pipeline.pipeline_dag, so a scheduled subject goes
+    through exactly what run_pipeline (or run_pipeline_incremental) does.
+    backends: one segmentation backend per concurrent segmentation.
+    results_db: optional SQLite results database every subject's scores are added to.
+    threads: threads per segmentation or CPU job (None: library defaults); I/O
+    jobs get one thread each.
+    label_mapping: GT name -> disc label (default: the OSF mapping of TS_pipeline).
+    """
+    def __init__(self, backends, cache=None, limits=None, trace=False, results_db=None, threads=None,
+                 incremental=False, label_mapping=None):
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.limits["segment"] = len(backends)
+        self.cache = cache
+        self.trace = trace
+        self.results_db = results_db
+        self.threads = threads
+        self.incremental = incremental
+        self.label_mapping = label_mapping
+        self._backends = list(backends)
+        self._pools = {}
+        self._threads = None
+
+    async def _stage(self, entry, stage):
+        async with self._semaphores[stage.resource]:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._pools[stage.resource], _run_stage, stage.fn, stage.args, stage.name, entry["image"],
+                entry["log_path"], entry["trace_path"])
+
+    async def _segment(self, entry, stage):
+        from spine_eval.main.TS_pipeline import run_stage
+        from spine_eval.main.instrument import Tracer, NULL_TRACER
+
+        async with self._semaphores["segment"]:
+            backend = self._free_backends.pop()
+            tracer = Tracer(entry["trace_path"], subject=entry["image"]) if entry["trace_path"] else NULL_TRACER
+            try:
+                def segment():
+                    # Segmentations run in threads of this process: process-wide counters (own CPU,
+                    # peak RSS, I/O) cover every concurrent one, so the record notes how many may
+                    # overlap. The model's own CPU and peak RSS come from the backend when it
+                    # reports them (last_usage). The worker backend's process is shared by all
+                    # subjects, so its prints stay on the console.
+                    with open(entry["log_path"], 'a') as log, _thread_output(log):
+                        return run_stage(stage, backend, tracer, segment_jobs=self.limits["segment"])
+                return await asyncio.get_running_loop().run_in_executor(self._threads, segment)
+            finally:
+                self._free_backends.append(backend)
+
+    async def _next_stage(self, entry, steps, result):
+        def advance():
+            # Up-to-date checks hash input files, so they run off the event loop, printing to the subject's log
+            with open(entry["log_path"], 'a') as log, _thread_output(log):
+                return _advance(steps, result)
+        return await asyncio.get_running_loop().run_in_executor(None, advance)
+
+    async def run_subject(self, entry):
+        """Run all stages of one manifest entry. Returns (status, error)."""
+        from spine_eval.main.TS_pipeline import TRACE_NAME, LABEL_MAPPING, subject_paths, pipeline_steps, pipeline_dag
+
+        work_dir = entry["work_dir"]
+        paths = subject_paths(work_dir)
+        os.makedirs(paths["seg_output_folder"], exist_ok=True)
+        entry = dict(entry, log_path=os.path.join(work_dir, "pipeline.log"), trace_path=None)
+        open(entry["log_path"], 'w').close()
+        if self.trace:
+            entry["trace_path"] = os.path.join(work_dir, TRACE_NAME)
+            if os.path.exists(entry["trace_path"]):
+                os.remove(entry["trace_path"])
+
+        try:
+            label_mapping = self.label_mapping or LABEL_MAPPING
+            reorient = entry.get("reorient", False)
+            if self.incremental:
+                graph = pipeline_dag(entry["image"], entry["ground_truth"], work_dir, self._backends[0], self.cache,
+                                     label_mapping=label_mapping, results_db=self.results_db, reorient=reorient)
+                steps = graph.steps()
+            else:
+                version = self._backends[0].version() if self.cache is not None else None
+                steps = pipeline_steps(entry["image"], entry["ground_truth"], paths, version, self.cache,
+                                       label_mapping=label_mapping, results_db=self.results_db, reorient=reorient)
+
+            result = None
+            while True:
+                stage, done = await self._next_stage(entry, steps, result)
+                if stage is None:
+                    break
+                if stage.resource == "segment":
+                    result = await self._segment(entry, stage)
+                else:
+                    result = await self._stage(entry, stage)
+            if self.incremental:
+                with open(entry["log_path"], 'a') as log:
+                    log.write("Stages: " + ", ".join(f"{name} {r}" for name, r in done.items()) + "\n")
+        except Exception as e:
+            with open(entry["log_path"], 'a') as log:
+                traceback.print_exc(file=log)
+            return STATUS_FAILED, f"{type(e).__name__}: {e}"
+        return STATUS_DONE, ""
+
+    async def run(self, entries, on_done=None):
+        """
+        Run every entry concurrently within the resource limits.
+        on_done(index, status, error) is called as each subject finishes.
+        """
+        self._semaphores = {name: asyncio.Semaphore(n) for name, n in self.limits.items()}
+        self._free_backends = list(self._backends)
+
+        async def one(i):
+            status, error = await self.run_subject(entries[i])
+            if on_done is not None:
+                on_done(i, status, error)
+            return status, error
+
+        ctx = mp.get_context("spawn")
+        cpu_init = io_init = {}
+        if self.threads is not None:
+            cpu_init = {"initializer": set_thread_budget, "initargs": (self.threads,)}
+            io_init = {"initializer": set_thread_budget, "initargs": (1,)}
+        with ProcessPoolExecutor(self.limits["cpu"], mp_context=ctx, **cpu_init) as cpu_pool, \
+                ProcessPoolExecutor(self.limits["io"], mp_context=ctx, **io_init) as io_pool, \
+                ThreadPoolExecutor(self.limits["segment"]) as threads, \
+                contextlib.redirect_stdout(_ThreadOutput(sys.stdout)), contextlib.redirect_stderr(_ThreadOutput(sys.stderr)):
+            self._pools = {"cpu": cpu_pool, "io": io_pool}
+            self._threads = threads
+            return await asyncio.gather(*(one(i) for i in range(len(entries))))
+
+def run_scheduled(manifest_path, limits=None, backend="subprocess", backend_kwargs=None,
+                  cache_dir=None, cache_max_bytes=None, trace=False, results_db=None, threads=None, preflight=None,
+                  incremental=False, label_mapping=None):
+    """
+    Run every subject of the manifest not yet marked as done with per-resource
+    concurrency limits (see DEFAULT_LIMITS). Like main.batch.run_batch, the
+    manifest is updated after each subject, so a rerun resumes where it stopped.
+    threads is the total core budget, split between the concurrent
+    segmentation and CPU jobs. preflight is a main.preflight report, used as
+    in run_batch. With incremental, every subject is revisited and only reruns
+    the stages whose inputs, parameters or code changed. label_mapping maps
+    GT names to disc labels (default: the OSF mapping).
+    """
+    from spine_eval.main.backends import get_backend
+    from spine_eval.main.cache import SegmentationCache
+
+    entries = load_manifest(manifest_path)
+    # Incremental runs revisit every subject: up-to-date stages are skipped cheaply
+    todo = [i for i, e in enumerate(entries) if incremental or e["status"] != STATUS_DONE]
+    print(f"{len(entries) - len(todo)} subjects already done, {len(todo)} to run.")
+    options = apply_preflight(manifest_path, entries, todo, preflight)
+    todo = list(options)
+
+    limits = dict(DEFAULT_LIMITS, **(limits or {}))
+    cache = SegmentationCache(cache_dir, cache_max_bytes) if cache_dir is not None else None
+    job_threads = per_worker_threads(threads, limits["segment"] + limits["cpu"])
+    if job_threads is not None:
+        print(f"{job_threads} threads per segmentation / CPU job.")
+        # Segmentations run from this process: backends (and their subprocesses) inherit the budget
+        set_thread_budget(job_threads)
+
+    def on_done(j, status, error):
+        i = todo[j]
+        entries[i]["status"] = status
+        entries[i]["error"] = error
+        save_manifest(manifest_path, entries)
+        print(f"[{status}] {entries[i]['image']}" + (f" ({error})" if error else ""))
+
+    backends = [get_backend(backend, **(backend_kwargs or {})) for _ in range(limits["segment"])]
+    try:
+        scheduler = PipelineScheduler(backends, cache, limits, trace, results_db, job_threads, incremental, label_mapping)
+        asyncio.run(scheduler.run([dict(entries[i], **options[i]) for i in todo], on_done))
+    finally:
+        for b in backends:
+            b.close()
+
+    failed = sum(e["status"] == STATUS_FAILED for e in entries)
+    print(f"Batch finished: {len(entries) - failed} done, {failed} failed.")
+    if trace:
+        save_trace_summary(manifest_path, entries)
+    return entries
+
+def cli(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Run the TotalSegmentator pipeline over a cohort manifest, "
+                                                 "with separate concurrency limits for segmentation, CPU and I/O stages.")
+    parser.add_argument("--manifest", type=str, required=True, help="CSV or JSON manifest with image, ground_truth and work_dir per subject")
+    parser.add_argument("--segment_jobs", type=int, default=DEFAULT_LIMITS["segment"], help="Concurrent segmentations (one backend each)")
+    parser.add_argument("--cpu_jobs", type=int, default=DEFAULT_LIMITS["cpu"], help="Concurrent labeling / Dice jobs")
+    parser.add_argument("--io_jobs", type=int, default=DEFAULT_LIMITS["io"], help="Concurrent hashing, cache, conversion and gzip jobs")
+    parser.add_argument("--backend", type=str, default="subprocess", help="Segmentation backend (subprocess, worker, stand-in)")
+    parser.add_argument("--stand_in_mask", type=str, default=None, help="Mask file or folder used by the stand-in backend")
+    parser.add_argument("--cache_dir", type=str, default=None, help="Reuse segmentation outputs cached in this folder")
+    parser.add_argument("--cache_max_gb", type=float, default=None, help="Size limit of the cache (LRU eviction)")
+    parser.add_argument("--trace", action="store_true", help="Record per-stage traces and save an aggregated summary")
+    parser.add_argument("--results_db", type=str, default=None, help="Add every subject's scores to this SQLite results database")
+    parser.add_argument("--preflight", type=str, default=None, help="Pre-flight report (main.preflight): skip subjects with errors, reorient flagged GT")
+    parser.add_argument("--incremental", action="store_true", help="Only rerun stages whose inputs, parameters or code changed")
+    parser.add_argument("--label_mapping", type=str, default=None, help="JSON file of GT name -> disc label (default: OSF mapping)")
+    add_thread_arguments(parser)
+    args = parser.parse_args(argv)
+
+    label_mapping = None
+    if args.label_mapping:
+        from spine_eval.utils.vertebrae import load_label_map
+        label_mapping = load_label_map(args.label_mapping)
+    limits = {"segment": args.segment_jobs, "cpu": args.cpu_jobs, "io": args.io_jobs}
+    backend_kwargs = {"mask_source": args.stand_in_mask} if args.backend == "stand-in" else {}
+    cache_max_bytes = int(args.cache_max_gb * 1e9) if args.cache_max_gb is not None else None
+    run_scheduled(args.manifest, limits, backend=args.backend, backend_kwargs=backend_kwargs,
+                  cache_dir=args.cache_dir, cache_max_bytes=cache_max_bytes, trace=args.trace,
+                  results_db=args.results_db, threads=args.threads, preflight=args.preflight,
+                  incremental=args.incremental, label_mapping=label_mapping)
+
+if __name__ == "__main__":
+    cli()
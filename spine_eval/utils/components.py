@@ -0,0 +1,207 @@
+import SimpleITK as sitk
+import numpy as np
+
+from spine_eval.utils.roi import bbox_origin, foreground_bbox, full_bbox
+
+class ComponentStats:
+    """
+    Per-component statistics of a label array, indexed by component label
+    (row 0 is the background and is left empty).
+    counts:    (n+1,) voxel count
+    centroids: (n+1, 3) mean voxel index in array order (z, y, x)
+    bbox_min:  (n+1, 3) first voxel index (z, y, x)
+    bbox_max:  (n+1, 3) last voxel index + 1 (z, y, x), usable as a slice end
+    """
+    def __init__(self, counts, centroids, bbox_min, bbox_max):
+        self.counts = counts
+        self.centroids = centroids
+        self.bbox_min = bbox_min
+        self.bbox_max = bbox_max
+
+    @property
+    def num_components(self):
+        return len(self.counts) - 1
+
+    def present(self):
+        """Labels of the non-empty components, in increasing order."""
+        return np.flatnonzero(self.counts[1:]) + 1
+
+    def bbox_slices(self, label):
+        """Bounding box of one component as a tuple of slices."""
+        return tuple(slice(lo, hi) for lo, hi in zip(self.bbox_min[label], self.bbox_max[label]))
+
+def connected_components(img):
+    """
+    Connected components of the non-zero voxels of a SimpleITK image.
+    Returns the component array (z, y, x), in the smallest dtype that holds
+    every component label, and the number of components.
+    """
+    # The filter treats non-zero voxels of integer images as foreground, so
+    # only non-integer images need an explicit mask
+    if not np.issubdtype(sitk.GetArrayViewFromImage(img).dtype, np.integer):
+        img = img != 0
+    cc_filter = sitk.ConnectedComponentImageFilter()
+    cc = cc_filter.Execute(img)
+    num = cc_filter.GetObjectCount()
+    # Copy out of the uint32 filter output straight into the narrow dtype
+    return sitk.GetArrayViewFromImage(cc).astype(np.min_scalar_type(num)), num
+
+def connected_components_roi(img, margin=1):
+    """
+    Connected components computed only inside the foreground bounding box
+    (plus margin) of a SimpleITK image. Returns the cropped component array,
+    the number of components and the bounding box; components are identical
+    to those of the full volume.
+    """
+    bbox = foreground_bbox(sitk.GetArrayViewFromImage(img), margin)
+    if bbox != full_bbox(img.GetSize()[::-1]):
+        # Crop in SimpleITK: only the region of interest is copied
+        img = sitk.RegionOfInterest(img, [s.stop - s.start for s in bbox[::-1]], [s.start for s in bbox[::-1]])
+    cc_arr, num = connected_components(img)
+    return cc_arr, num, bbox
+
+def _coarse_mask(arr, factor):
+    # Block-wise "any" of an array: a coarse voxel is set when any of its
+    # factor^3 voxels is non-zero (partial blocks at the end included). One
+    # axis at a time with strided views, so arr is read once and not copied.
+    mask = arr
+    for axis in range(arr.ndim):
+        shape = list(mask.shape)
+        shape[axis] = -(-shape[axis] // factor)
+        out = np.zeros(shape, dtype=bool)
+        for i in range(factor):
+            part = mask[(slice(None),) * axis + (slice(i, None, factor),)]
+            out[(slice(None),) * axis + (slice(0, part.shape[axis]),)] |= part != 0
+        mask = out
+    return mask
+
+def connected_components_coarse(img, factor=2, margin=1, min_voxels=0):
+    """
+    Coarse-to-fine variant of connected_components_roi: components are found
+    on the mask downsampled by factor (block-wise "any"), then labeled at full
+    resolution only inside the box of each coarse component. Fine voxels that
+    touch fall in touching coarse blocks, so the components are the same as
+    connected_components_roi's (numbered differently); coarse connections
+    that are not there at full resolution are split by the refinement.
+    Coarse components that cannot hold min_voxels fine voxels are dropped
+    without being kept or measured; only their fine components are counted.
+    Returns the cropped component array, the number of components, the
+    bounding box, the ComponentStats (full-volume coordinates), computed
+    inside the refined boxes only, and the number of dropped components.
+    """
+    arr = sitk.GetArrayViewFromImage(img)
+    bbox = foreground_bbox(arr, margin)
+    roi = arr[bbox]
+    coarse_arr, num_coarse = connected_components(sitk.GetImageFromArray(_coarse_mask(roi, factor).view(np.uint8)))
+    coarse_stats = component_stats(coarse_arr, num_coarse)
+
+    parts, num, skipped = [], 0, 0
+    for k in coarse_stats.present():
+        coarse_box = coarse_stats.bbox_slices(k)
+        fine_box = tuple(slice(s.start * factor, min(s.stop * factor, n)) for s, n in zip(coarse_box, roi.shape))
+        # Coarse labels at full resolution: only the voxels of component k are labeled here
+        owner = coarse_arr[coarse_box][np.ix_(*[np.arange(s.stop - s.start) // factor for s in fine_box])]
+        sub = (roi[fine_box] != 0) & (owner == k)
+        sub_arr, sub_num = connected_components(sitk.GetImageFromArray(sub.view(np.uint8)))
+        if coarse_stats.counts[k] * factor ** roi.ndim < min_voxels:
+            # Every fine component in it is smaller than min_voxels: counted, not kept
+            skipped += sub_num
+            continue
+        origin = bbox_origin(bbox) + bbox_origin(fine_box)
+        parts.append((fine_box, sub_arr, num, component_stats(sub_arr, sub_num, origin=origin)))
+        num += sub_num
+
+    cc_arr = np.zeros(roi.shape, dtype=np.min_scalar_type(num))
+    for fine_box, sub_arr, offset, _ in parts:
+        fg = sub_arr != 0
+        cc_arr[fine_box][fg] = sub_arr[fg].astype(cc_arr.dtype) + cc_arr.dtype.type(offset)
+
+    # Row 0 (background) then the components of each part, in label order
+    stats = ComponentStats(*(np.concatenate([np.zeros_like(getattr(coarse_stats, name)[:1])]
+                                            + [getattr(part[3], name)[1:] for part in parts])
+                             for name in ("counts", "centroids", "bbox_min", "bbox_max")))
+    return cc_arr, num, bbox, stats, skipped
+
+def component_stats(label_arr, num_labels=None, origin=None):
+    """
+    Compute voxel count, centroid and bounding box of every label in one pass
+    over the foreground voxels (weighted bincount), instead of one full-volume
+    scan per label. origin (z, y, x) is added to centroids and boxes, so stats
+    of a cropped array are reported in full-volume coordinates.
+    """
+    if num_labels is None:
+        num_labels = int(label_arr.max(initial=0))
+    n = num_labels + 1
+
+    coords = np.nonzero(label_arr)
+    labels = label_arr[coords].astype(np.intp)
+
+    counts = np.bincount(labels, minlength=n)
+    safe_counts = np.maximum(counts, 1)[:, None]
+    centroids = np.stack([np.bincount(labels, weights=c, minlength=n) for c in coords], axis=1) / safe_counts
+
+    bbox_min = np.zeros((n, label_arr.ndim), dtype=np.intp)
+    bbox_max = np.zeros((n, label_arr.ndim), dtype=np.intp)
+    if labels.size:
+        # Group voxels by label, then reduce each group to its min/max
+        order = np.argsort(labels, kind='stable')
+        sorted_labels = labels[order]
+        starts = np.flatnonzero(np.r_[True, sorted_labels[1:] != sorted_labels[:-1]])
+        present = sorted_labels[starts]
+        for axis, c in enumerate(coords):
+            c = c[order]
+            bbox_min[present, axis] = np.minimum.reduceat(c, starts)
+            bbox_max[present, axis] = np.maximum.reduceat(c, starts) + 1
+
+    if origin is not None:
+        present = counts > 0
+        centroids[present] += origin
+        bbox_min[present] += origin
+        bbox_max[present] += origin
+
+    return ComponentStats(counts, centroids, bbox_min, bbox_max)
+
+def filter_components(stats, spacing, min_volume, merge=False):
+    """
+    Handle components smaller than min_volume (mm^3, voxel volume from the
+    (x, y, z) spacing). Returns a mapping old label -> label to keep (itself
+    for large components) and the labels of the small ones. Small components
+    are dropped (left out of the mapping), or with merge mapped to the large
+    component whose bounding box is nearest to their centroid (in mm).
+    """
+    spacing_zyx = np.asarray(spacing, dtype=float)[::-1]
+    present = stats.present()
+    volumes = stats.counts[present] * float(np.prod(spacing_zyx))
+    large, small = present[volumes >= min_volume], present[volumes < min_volume]
+
+    mapping = {int(k): int(k) for k in large}
+    if merge and large.size:
+        for k in small:
+            # Distance (mm) from the centroid to the nearest point of each large component's box
+            gap = np.maximum(stats.bbox_min[large] - stats.centroids[k], stats.centroids[k] - (stats.bbox_max[large] - 1))
+            dist = np.linalg.norm(np.maximum(gap, 0) * spacing_zyx, axis=1)
+            mapping[int(k)] = int(large[np.argmin(dist)])
+    return mapping, [int(k) for k in small]
+
+# Voxels relabelled per lookup, which bounds numpy's intp copy of the index array
+RELABEL_CHUNK_VOXELS = 1 << 22
+
+def relabel(label_arr, mapping, num_labels=None, dtype=np.uint8):
+    """
+    Relabel an array with a lookup table, slab by slab along the first axis.
+    mapping: dict old_label -> new_label; unmapped labels become 0.
+    """
+    if num_labels is None:
+        num_labels = max(int(label_arr.max(initial=0)), max(mapping, default=0))
+    lut = np.zeros(num_labels + 1, dtype=dtype)
+    for old, new in mapping.items():
+        lut[old] = new
+
+    out = np.empty(label_arr.shape, dtype=dtype)
+    if label_arr.ndim == 0 or label_arr.size == 0:
+        out[...] = lut[label_arr]
+        return out
+    step = max(1, RELABEL_CHUNK_VOXELS // max(label_arr[0].size, 1))
+    for start in range(0, label_arr.shape[0], step):
+        np.take(lut, label_arr[start:start + step], out=out[start:start + step])
+    return out
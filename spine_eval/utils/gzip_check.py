@@ -0,0 +1,194 @@
+import argparse
+import os
+import struct
+import uuid
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+GZIP_MAGIC = b'\x1f\x8b'
+# Smallest possible gzip member: 10-byte header, empty deflate block, 8-byte trailer
+GZIP_MIN_SIZE = 20
+
+# Uncompressed block size used by the parallel compressor
+BLOCK_SIZE = 1 << 20
+# Maximum output produced per decompress call when verifying, keeps memory constant
+VERIFY_CHUNK = 1 << 20
+# Size of the deflate window; each block is primed with this much of the previous one
+WINDOW_SIZE = 1 << 15
+
+def sniff_gzip(path):
+    """
+    Near-instant check of the gzip header: magic bytes, deflate method and
+    reserved flag bits. Does not read the compressed stream.
+    """
+    try:
+        if os.path.getsize(path) < GZIP_MIN_SIZE:
+            return False
+        with open(path, 'rb') as f:
+            header = f.read(10)
+    except OSError:
+        return False
+    return header[:2] == GZIP_MAGIC and header[2] == 8 and header[3] & 0xE0 == 0
+
+def verify_gzip_stream(path, chunk_size=VERIFY_CHUNK):
+    """
+    Decompress the whole file in constant memory, checking the CRC32 and length
+    of every gzip member. Returns True only if the stream is complete and intact.
+    """
+    try:
+        with open(path, 'rb') as f:
+            d = zlib.decompressobj(wbits=31)
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                while chunk:
+                    if d.eof:
+                        # Concatenated members are valid gzip; trailing zero padding is ignored
+                        if not chunk.strip(b'\x00'):
+                            break
+                        d = zlib.decompressobj(wbits=31)
+                    d.decompress(chunk, chunk_size)
+                    chunk = d.unused_data if d.eof else d.unconsumed_tail
+            # Drain output still buffered inside the decompressor
+            while not d.eof and d.decompress(b'', chunk_size):
+                pass
+            return d.eof
+    except (OSError, zlib.error):
+        return False
+
+def is_valid_gzip(path, full=False):
+    """Header sniff, plus a streaming CRC check of the whole file when full is set."""
+    return sniff_gzip(path) and (not full or verify_gzip_stream(path))
+
+def _compress_block(block, zdict, level):
+    # Raw deflate (no header); the shared gzip header and trailer are written by write_gzip_member
+    kwargs = {"zdict": zdict} if zdict else {}
+    c = zlib.compressobj(level, zlib.DEFLATED, -15, **kwargs)
+    return c.compress(block) + c.flush(zlib.Z_SYNC_FLUSH)
+
+def write_gzip_member(chunks, f_out, level=6, threads=None, block_size=BLOCK_SIZE):
+    """
+    Write the byte chunks (any sizes) to the open file f_out as a single
+    standard gzip member. Blocks of block_size are deflated in parallel (each
+    primed with the previous 32 KiB, like pigz).
+    """
+    threads = threads or os.cpu_count() or 1
+    crc, size = 0, 0
+    with ThreadPoolExecutor(threads) as pool:
+        xfl = b'\x02' if level >= 9 else b'\x04' if level <= 1 else b'\x00'
+        f_out.write(GZIP_MAGIC + b'\x08\x00' + b'\x00\x00\x00\x00' + xfl + b'\xff')
+
+        pending = deque()
+        prev_tail = b''
+        for block in _blocks(chunks, block_size):
+            crc = zlib.crc32(block, crc)
+            size += len(block)
+            pending.append(pool.submit(_compress_block, block, prev_tail, level))
+            prev_tail = block[-WINDOW_SIZE:]
+            # Bound the number of blocks held in memory
+            while len(pending) > 2 * threads:
+                f_out.write(pending.popleft().result())
+        while pending:
+            f_out.write(pending.popleft().result())
+
+        f_out.write(zlib.compressobj(level, zlib.DEFLATED, -15).flush())  # final empty block
+        f_out.write(struct.pack('<II', crc & 0xFFFFFFFF, size & 0xFFFFFFFF))
+
+def _blocks(chunks, block_size):
+    # Regroup chunks into blocks of block_size bytes (the last one may be shorter)
+    buf = bytearray()
+    for chunk in chunks:
+        chunk = memoryview(chunk).cast('B')
+        while len(buf) + len(chunk) >= block_size:
+            if not buf:
+                # Whole blocks are passed as views of the chunk, without copying
+                yield chunk[:block_size]
+                chunk = chunk[block_size:]
+                continue
+            cut = block_size - len(buf)
+            buf += chunk[:cut]
+            yield bytes(buf)
+            buf = bytearray()
+            chunk = chunk[cut:]
+        buf += chunk
+    if buf:
+        yield bytes(buf)
+
+def compress_file(src_path, dst_path, level=6, threads=None, block_size=BLOCK_SIZE):
+    """
+    Gzip src_path into dst_path with a multi-threaded block compressor (see
+    write_gzip_member). The output is written to a temporary file and
+    renamed, so dst_path is never left half-written.
+    """
+    tmp_path = f"{dst_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(src_path, 'rb') as f_in, open(tmp_path, 'wb') as f_out:
+            write_gzip_member(iter(lambda: f_in.read(block_size), b''), f_out, level, threads, block_size)
+        os.replace(tmp_path, dst_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return dst_path
+
+def check_and_fix_gzip(file_path, full=False, level=6, threads=None):
+    """
+    Ensure that a .nii.gz file is a valid gzip. If not, recompress it properly.
+    With full, the whole stream is decompressed to check its CRC; a file with a
+    valid gzip header but a corrupted stream cannot be repaired and raises.
+    """
+    if not file_path.endswith(".nii.gz"):
+        raise ValueError("File must have .nii.gz extension")
+
+    if sniff_gzip(file_path):
+        if full and not verify_gzip_stream(file_path):
+            raise ValueError(f"{file_path} has a gzip header but a truncated or corrupted stream.")
+        print(f"{file_path} is a valid gzip file.")
+        return file_path
+
+    # Not a gzip at all (e.g. an uncompressed NIfTI saved as .nii.gz) – fix it in place
+    print(f"{file_path} is NOT a valid gzip file. Fixing...")
+    compress_file(file_path, file_path, level=level, threads=threads)
+
+    print(f"Recompressed {file_path} to valid gzip")
+    return file_path
+
+def check_directory(folder, full=False, fix=False, workers=None, level=6, threads=None):
+    """
+    Validate every .nii.gz file in folder in parallel.
+    Returns a dict path -> 'valid', 'invalid', 'fixed' or 'corrupted'.
+    """
+    paths = sorted(os.path.join(folder, f) for f in os.listdir(folder) if f.endswith(".nii.gz"))
+
+    def check_one(path):
+        if not sniff_gzip(path):
+            if fix:
+                compress_file(path, path, level=level, threads=threads)
+                return path, "fixed"
+            return path, "invalid"
+        if full and not verify_gzip_stream(path):
+            return path, "corrupted"
+        return path, "valid"
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return dict(pool.map(check_one, paths))
+
+def cli(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Check (and optionally fix) .nii.gz files.")
+    parser.add_argument("path", type=str, help="A .nii.gz file or a folder of .nii.gz files")
+    parser.add_argument("--full", action="store_true", help="Decompress the whole stream to verify its CRC")
+    parser.add_argument("--fix", action="store_true", help="Recompress files that are not gzip")
+    parser.add_argument("--workers", type=int, default=None, help="Files checked in parallel")
+    parser.add_argument("--threads", type=int, default=None, help="Compression threads per file")
+    parser.add_argument("--level", type=int, default=6, help="Compression level used when fixing (1-9)")
+    args = parser.parse_args(argv)
+
+    if os.path.isdir(args.path):
+        results = check_directory(args.path, args.full, args.fix, args.workers, args.level, args.threads)
+        for path, status in results.items():
+            print(f"{status:10s} {path}")
+    elif args.fix:
+        check_and_fix_gzip(args.path, args.full, args.level, args.threads)
+    else:
+        print(f"{args.path}: {'valid' if is_valid_gzip(args.path, args.full) else 'invalid'}")
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,12 @@
+import hashlib
+
+# Read size used when hashing files
+HASH_BLOCK_SIZE = 1 << 20
+
+def hash_file(path):
+    """Hash the content of a file (BLAKE2b, streamed)."""
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            h.update(block)
+    return h.hexdigest()
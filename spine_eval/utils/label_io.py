@@ -0,0 +1,171 @@
+import os
+import uuid
+
+import nibabel as nib
+import numpy as np
+import SimpleITK as sitk
+
+from spine_eval.utils.gzip_check import write_gzip_member
+from spine_eval.utils.threads import thread_settings
+from spine_eval.utils.volume import CROP_NOTE, crop_extent, image_from_roi
+
+# gzip level of labeled masks. They are mostly zeros: level 1 deflates them
+# about 2.5x faster than zlib's default level 6, for a file ~4x larger (still
+# well under 1 MB for a 512x512x600 volume)
+DEFAULT_LEVEL = 1
+
+# SimpleITK directions and origins are LPS, NIfTI affines are RAS
+_LPS_TO_RAS = np.diag([-1.0, -1.0, 1.0])
+
+def _tmp_path(path):
+    # Same folder (so the final rename is atomic) and same extension (SimpleITK picks the format from it)
+    folder, name = os.path.split(path)
+    return os.path.join(folder, f".{uuid.uuid4().hex}.{name}")
+
+def _crop_geometry(sub_arr, bbox, geometry):
+    # Geometry of the grid holding only sub_arr, and the CROP_NOTE describing it
+    size, origin, spacing, direction = geometry
+    start = [s.start for s in bbox[::-1]]  # x, y, z
+    rotation = np.reshape(direction, (3, 3))
+    crop_origin = np.asarray(origin) + rotation @ (np.asarray(start) * np.asarray(spacing))
+    return (sub_arr.shape[::-1], tuple(crop_origin), spacing, direction), CROP_NOTE.format(*start, *size)
+
+def cropped_image(sub_arr, bbox, geometry):
+    """
+    SimpleITK image of only sub_arr, placed at bbox (array order) in physical
+    space, with the full grid recorded in its description (see CROP_NOTE).
+    """
+    (_, origin, spacing, direction), note = _crop_geometry(sub_arr, bbox, geometry)
+    img = sitk.GetImageFromArray(sub_arr)
+    img.SetOrigin(origin)
+    img.SetSpacing(spacing)
+    img.SetDirection(direction)
+    # Written by ITK as the NIfTI description field
+    img.SetMetaData("ITK_FileNotes", note)
+    return img
+
+def nifti_header(geometry, dtype, descrip=None):
+    """
+    NIfTI-1 header of a 3D volume with the given geometry (see
+    utils.volume.image_geometry) and dtype, with qform and sform set as
+    SimpleITK writes them.
+    """
+    size, origin, spacing, direction = geometry
+    affine = np.eye(4)
+    affine[:3, :3] = _LPS_TO_RAS @ np.reshape(direction, (3, 3)) * np.asarray(spacing)
+    affine[:3, 3] = _LPS_TO_RAS @ np.asarray(origin)
+
+    header = nib.Nifti1Header()
+    header.set_data_dtype(dtype)
+    header.set_data_shape(size)
+    header.set_zooms(spacing)
+    header.set_qform(affine, code=1)
+    header.set_sform(affine, code=1)
+    header.set_xyzt_units("mm", "sec")
+    if descrip is not None:
+        header["descrip"] = descrip.encode("ascii")[:80]
+    header["vox_offset"] = 352
+    return header
+
+def _planes(sub_arr, bbox, size):
+    # z planes of the full volume holding sub_arr at bbox; only one plane is
+    # built at a time, and planes outside bbox share one zero buffer
+    depth, rows, cols = size[::-1]
+    zero = np.zeros((rows, cols), sub_arr.dtype)
+    for z in range(depth):
+        if bbox[0].start <= z < bbox[0].stop:
+            # A new buffer each time: the compressor may still hold the previous one
+            plane = np.zeros((rows, cols), sub_arr.dtype)
+            plane[bbox[1], bbox[2]] = sub_arr[z - bbox[0].start]
+            yield plane
+        else:
+            yield zero
+
+def write_nifti_gz(chunks, header, output_path, level=DEFAULT_LEVEL, threads=None):
+    """
+    Write a .nii.gz from its header and voxel data (byte chunks in NIfTI
+    order), gzipped at `level` (0-9) by the parallel block compressor as one
+    standard gzip member. Nothing is written uncompressed to disk, and the
+    file appears at output_path only once complete.
+    """
+    # Within the thread budget of this process, if one is set (see utils.threads)
+    threads = threads or thread_settings()["threads"]
+    tmp_path = _tmp_path(output_path)
+    try:
+        with open(tmp_path, 'wb') as f:
+            # 348-byte header, then 4 zero bytes: no extensions
+            write_gzip_member([header.binaryblock, b'\x00' * 4, *chunks], f, level, threads)
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return output_path
+
+def write_image(img, output_path, level=DEFAULT_LEVEL):
+    """Write a SimpleITK image at `level` (0-9, 0: uncompressed), renamed into place once complete."""
+    tmp_path = _tmp_path(output_path)
+    try:
+        sitk.WriteImage(img, tmp_path, level > 0, level if level > 0 else -1)
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return output_path
+
+def write_label_map(sub_arr, bbox, geometry, output_path, label_dict=None, label_txt_path=None,
+                    level=DEFAULT_LEVEL, threads=None, cropped=False):
+    """
+    Write a labeled mask given by its non-empty extent (sub_arr at bbox, array
+    order, on the grid of utils.volume.image_geometry) and its "label: name"
+    sidecar. .nii.gz outputs are streamed plane by plane into the parallel
+    gzip writer (see write_nifti_gz), other formats go through SimpleITK. With
+    cropped, only the extent is stored (for internal intermediates, expanded
+    again by read_label_map and utils.volume.load_label_volume). Both files are
+    fully written under temporary names before either is renamed into place.
+    """
+    if cropped and not output_path.endswith((".nii", ".nii.gz")):
+        # The full grid is recorded in the NIfTI description field
+        raise ValueError(f"Cropped label maps must be NIfTI files: {output_path}")
+    tmp_txt = None
+    if label_txt_path is not None:
+        tmp_txt = _tmp_path(label_txt_path)
+        with open(tmp_txt, 'w') as f:
+            for k, v in (label_dict or {}).items():
+                f.write(f"{k}: {v}\n")
+    try:
+        if output_path.endswith(".nii.gz"):
+            if cropped:
+                crop_geometry, note = _crop_geometry(sub_arr, bbox, geometry)
+                header = nifti_header(crop_geometry, sub_arr.dtype, note)
+                chunks = [np.ascontiguousarray(sub_arr)]
+            else:
+                header = nifti_header(geometry, sub_arr.dtype)
+                chunks = _planes(sub_arr, bbox, geometry[0])
+            write_nifti_gz(chunks, header, output_path, level, threads)
+        else:
+            img = cropped_image(sub_arr, bbox, geometry) if cropped else image_from_roi(sub_arr, bbox, geometry)
+            write_image(img, output_path, level)
+        if tmp_txt is not None:
+            os.replace(tmp_txt, label_txt_path)
+    finally:
+        if tmp_txt is not None and os.path.exists(tmp_txt):
+            os.remove(tmp_txt)
+    return output_path
+
+def read_label_map(path):
+    """Read a label map with SimpleITK, expanding a cropped one to its full grid."""
+    img = sitk.ReadImage(path)
+    extent = crop_extent(img.GetMetaData("descrip")) if img.HasMetaDataKey("descrip") else None
+    if extent is None:
+        return img
+    offset, size = extent
+    upper = [n - o - s for n, o, s in zip(size, offset, img.GetSize())]
+    # Padding moves the origin, so the full grid starts where the original one did
+    return sitk.ConstantPad(img, offset, upper, 0)
+
+def add_writer_arguments(parser):
+    """Add the output options shared by the disc labeling tools."""
+    parser.add_argument("--level", type=int, default=DEFAULT_LEVEL, help="gzip level of .nii.gz outputs (0-9)")
+    parser.add_argument("--threads", type=int, default=None, help="Compression threads")
+    parser.add_argument("--cropped", action="store_true", help="Store only the labeled extent (internal intermediates)")
+    return parser
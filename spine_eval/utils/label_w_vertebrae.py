@@ -0,0 +1,78 @@
+import SimpleITK as sitk
+import os
+import argparse
+
+from spine_eval.utils.components import connected_components_roi, component_stats, relabel
+from spine_eval.utils.prefetch import load_in_background
+from spine_eval.utils.roi import bbox_origin
+from spine_eval.utils.label_io import DEFAULT_LEVEL, write_label_map, add_writer_arguments
+from spine_eval.utils.volume import image_geometry
+from spine_eval.utils.vertebrae import load_label_map, load_vertebrae_centers
+# Re-exported for code that imported them from here before they moved to utils.vertebrae
+from spine_eval.utils.vertebrae import vertebrae_order, load_mask_and_center  # noqa: F401
+
+def main(vertebrae_folder, disc_path, output_path, label_txt_path, multilabel_path=None, label_map=None,
+         level=DEFAULT_LEVEL, threads=None, cropped=False):
+    # Decode the disc mask in the background while the vertebra centers are computed
+    disc_future = load_in_background(sitk.ReadImage, disc_path)
+
+    # Find vertebrae centers, from one multilabel volume if given, else from per-vertebra masks
+    vertebrae_centers = list(load_vertebrae_centers(vertebrae_folder, multilabel_path, label_map).items())
+
+    # Order vertebrae by z coordinate
+    vertebrae_centers.sort(key=lambda x: x[1][2])
+
+    # Upload disc mask
+    disc_img = disc_future.result()
+
+    # Connected components and their centers in one pass
+    geometry = image_geometry(disc_img)
+    cc_arr, num_discs, bbox = connected_components_roi(disc_img)
+    del disc_img, disc_future  # only the cropped components are kept from here on
+    stats = component_stats(cc_arr, num_discs, origin=bbox_origin(bbox))
+
+    label_dict = {}
+    new_labels = {}
+    label = 1
+
+    for i in stats.present():
+        center = stats.centroids[i][::-1]  # z,y,x → x,y,z
+        center_z = center[2]
+
+        # Find the vertebrae on top and bottom of the disc, assign label
+        for v1, v2 in zip(vertebrae_centers[:-1], vertebrae_centers[1:]):
+            z1 = v1[1][2]
+            z2 = v2[1][2]
+            if z1 <= center_z <= z2:
+                new_labels[i] = label
+                label_dict[label] = f"{v1[0].replace('vertebrae_', '')}-{v2[0].replace('vertebrae_', '')}"
+                label += 1
+                break
+
+    # Save output mask and dictionary of labels
+    write_label_map(relabel(cc_arr, new_labels, num_discs), bbox, geometry, output_path, label_dict, label_txt_path,
+                    level, threads, cropped)
+    print(f"Saved labeled discs to: {output_path}")
+    print(f"Saved label map to: {label_txt_path}")
+
+def cli(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Assegna etichette ai dischi intervertebrali usando le maschere delle vertebre.")
+    parser.add_argument("--vertebrae_folder", type=str, default=None, help="Cartella con le maschere delle vertebre (.nii.gz)")
+    parser.add_argument("--multilabel_path", type=str, default=None, help="Segmentazione multilabel unica con tutte le vertebre (es. TotalSegmentator --ml)")
+    parser.add_argument("--label_map", type=str, default=None, help="File JSON che associa i nomi delle vertebre ai valori della segmentazione multilabel")
+    parser.add_argument("--disc_path", type=str, required=True, help="Percorso alla maschera dei dischi (unica .nii.gz)")
+    parser.add_argument("--output_path", type=str, required=True, help="Percorso del file NIfTI con dischi etichettati")
+    add_writer_arguments(parser)
+    args = parser.parse_args(argv)
+    if (args.vertebrae_folder is None) == (args.multilabel_path is None):
+        parser.error("Specificare esattamente uno tra --vertebrae_folder e --multilabel_path")
+    label_map = load_label_map(args.label_map) if args.label_map else None
+
+    # Genera automaticamente path per label.txt
+    label_txt_path = os.path.splitext(args.output_path)[0] + "_labels.txt"
+
+    main(args.vertebrae_folder, args.disc_path, args.output_path, label_txt_path, args.multilabel_path, label_map,
+         args.level, args.threads, args.cropped)
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,148 @@
+import argparse
+import json
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from glob import glob
+import SimpleITK as itk
+
+from spine_eval.utils.gzip_check import compress_file
+from spine_eval.utils.hashing import hash_file
+
+# Output modes: ITK's default gzip, fast parallel gzip (level 1) or plain .nii
+COMPRESSION_MODES = ["default", "fast", "none"]
+
+# Per output folder record of the input hash each output was converted from
+HASH_INDEX_NAME = ".mha2nifti.json"
+
+# Function to split a file path into directory, base name, and extension
+def split_filename(filepath):
+    path = os.path.dirname(filepath)
+    filename = os.path.basename(filepath)
+    base, ext = os.path.splitext(filename)
+    if ext == '.gz':
+        base, ext2 = os.path.splitext(base)
+        ext = ext2 + ext
+    return path, base, ext
+
+def _tmp_path(path, ext=None):
+    # Hidden unique name in the same folder (so the final rename is atomic); ITK picks the format from ext
+    folder, name = os.path.split(path)
+    if ext is not None:
+        name = split_filename(name)[1] + ext
+    return os.path.join(folder, f".{uuid.uuid4().hex}.{name}")
+
+def output_path(fn, output_dir, compression="default"):
+    """Path of the NIfTI file produced for fn in output_dir."""
+    _, base, _ = split_filename(fn)
+    return os.path.join(output_dir, base + ('.nii' if compression == "none" else '.nii.gz'))
+
+def convert_file(fn, out_fn, compression="default", threads=None):
+    """
+    Convert a single .mha file to NIfTI.
+    "fast" writes an uncompressed .nii and gzips it with the parallel block
+    compressor at level 1; "none" expects a .nii output path. The output is
+    written under a temporary name and renamed, so an interrupted conversion
+    never leaves a partial file at out_fn.
+    """
+    if compression not in COMPRESSION_MODES:
+        raise ValueError(f"Unknown compression mode '{compression}'. Choose from: {', '.join(COMPRESSION_MODES)}")
+    img = itk.ReadImage(fn)
+    if compression == "fast":
+        tmp_fn = _tmp_path(out_fn, '.nii')
+        try:
+            itk.WriteImage(img, tmp_fn, False)
+            # compress_file renames its own temporary output into place
+            compress_file(tmp_fn, out_fn, level=1, threads=threads)
+        finally:
+            if os.path.exists(tmp_fn):
+                os.remove(tmp_fn)
+    else:
+        tmp_fn = _tmp_path(out_fn)
+        try:
+            itk.WriteImage(img, tmp_fn, compression == "default")
+            os.replace(tmp_fn, out_fn)
+        finally:
+            if os.path.exists(tmp_fn):
+                os.remove(tmp_fn)
+    return out_fn
+
+def _load_hash_index(output_dir):
+    try:
+        with open(os.path.join(output_dir, HASH_INDEX_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_hash_index(output_dir, index):
+    path = os.path.join(output_dir, HASH_INDEX_NAME)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(index, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+def is_up_to_date(fn, out_fn, index=None):
+    """
+    True if out_fn is newer than fn, or was converted from a file with the
+    same content hash (e.g. an input copied without preserving mtime).
+    """
+    if not os.path.exists(out_fn):
+        return False
+    if os.path.getmtime(out_fn) >= os.path.getmtime(fn):
+        return True
+    recorded = (index or {}).get(os.path.basename(out_fn))
+    return recorded is not None and recorded == hash_file(fn)
+
+# Convert .mha files to .nii.gz format
+def mha_to_nifti(input_path, output_dir, workers=None, compression="default", force=False, use_processes=False):
+    """
+    Convert one .mha file, or every .mha file in a directory, to NIfTI.
+    Files whose output is already up to date are skipped unless force is set.
+    Conversions run on a thread pool (or a process pool with use_processes).
+    Returns the list of output paths, in input order.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    if os.path.isfile(input_path):
+        mha_files = [input_path]
+    else:
+        mha_files = sorted(glob(os.path.join(input_path, '*.mha')))
+    if not mha_files:
+        raise FileNotFoundError(f"No .mha files found in: {input_path}")
+
+    index = _load_hash_index(output_dir)
+    out_files = [output_path(fn, output_dir, compression) for fn in mha_files]
+    todo = []
+    for fn, out_fn in zip(mha_files, out_files):
+        if not force and is_up_to_date(fn, out_fn, index):
+            print(f'Up to date, skipping: {out_fn}')
+        else:
+            todo.append((fn, out_fn))
+
+    if todo:
+        # With several files in flight, keep one compression thread per file
+        threads = 1 if len(todo) > 1 else None
+        pool_cls = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        with pool_cls(max_workers=workers) as pool:
+            futures = [pool.submit(convert_file, fn, out_fn, compression, threads) for fn, out_fn in todo]
+            for (fn, out_fn), future in zip(todo, futures):
+                future.result()
+                index[os.path.basename(out_fn)] = hash_file(fn)
+                print(f'Converted {fn} -> {out_fn}')
+        _save_hash_index(output_dir, index)
+
+    return out_files
+
+def cli(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Convert .mha images to NIfTI.")
+    parser.add_argument("--input", type=str, required=True, help="A .mha file or a folder of .mha files")
+    parser.add_argument("--output_dir", type=str, required=True, help="Output folder")
+    parser.add_argument("--workers", type=int, default=None, help="Files converted in parallel")
+    parser.add_argument("--compression", type=str, default="default", choices=COMPRESSION_MODES, help="Output compression")
+    parser.add_argument("--processes", action="store_true", help="Use a process pool instead of threads")
+    parser.add_argument("--force", action="store_true", help="Convert even if the output is up to date")
+    args = parser.parse_args(argv)
+
+    mha_to_nifti(args.input, args.output_dir, args.workers, args.compression, args.force, args.processes)
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,82 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import nibabel as nib
+import numpy as np
+
+# Volumes loaded ahead of the one being processed
+DEFAULT_DEPTH = 2
+
+def volume_nbytes(path):
+    """
+    Estimated decoded size of a volume, from its NIfTI header (no voxel data
+    is read). Other formats fall back to the file size.
+    """
+    try:
+        header = nib.load(path).header
+        return int(np.prod(header.get_data_shape())) * header.get_data_dtype().itemsize
+    except Exception:
+        return os.path.getsize(path)
+
+def prefetch(paths, loader, depth=DEFAULT_DEPTH, max_bytes=None, workers=None, size_fn=volume_nbytes):
+    """
+    Yield (path, loader(path)) for every path, in order, while the next
+    `depth` volumes are loaded (and decompressed) on background threads.
+
+    max_bytes caps the estimated memory held at once (the volume being
+    processed plus the ones loaded ahead, sized by size_fn); one volume is
+    always loaded, even when it alone exceeds the budget.
+    Errors raised by the loader are re-raised when their volume is reached.
+    """
+    paths = list(paths)
+    depth = max(1, depth)
+    pending = deque()  # (path, future, estimated bytes)
+    next_index = 0
+
+    def top_up(held):
+        nonlocal next_index
+        while next_index < len(paths) and len(pending) < depth:
+            path = paths[next_index]
+            est = size_fn(path) if max_bytes is not None else 0
+            in_use = held + sum(e for _, _, e in pending)
+            if max_bytes is not None and in_use and in_use + est > max_bytes:
+                break
+            pending.append((path, pool.submit(loader, path), est))
+            next_index += 1
+
+    pool = ThreadPoolExecutor(max_workers=workers or depth)
+    try:
+        top_up(0)
+        while pending:
+            path, future, est = pending.popleft()
+            item = future.result()
+            # The volume handed out still counts against the budget while it is processed
+            top_up(est)
+            yield path, item
+            del item
+            if not pending:
+                top_up(0)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def load_in_background(loader, *args):
+    """
+    Start loader(*args) on a background thread and return its future, so a
+    volume can be decoded while something else is computed.
+    """
+    pool = ThreadPoolExecutor(max_workers=1)
+    future = pool.submit(loader, *args)
+    pool.shutdown(wait=False)
+    return future
+
+def add_prefetch_arguments(parser):
+    """Add the --prefetch / --prefetch_mb options shared by the command line tools."""
+    parser.add_argument("--prefetch", type=int, default=DEFAULT_DEPTH, help="Volumes loaded ahead on background threads")
+    parser.add_argument("--prefetch_mb", type=float, default=None, help="Memory budget (MB) of the prefetched volumes")
+    return parser
+
+def prefetch_options(args):
+    """(depth, max_bytes) from parsed --prefetch / --prefetch_mb options."""
+    max_bytes = int(args.prefetch_mb * 2 ** 20) if args.prefetch_mb is not None else None
+    return args.prefetch, max_bytes
@@ -0,0 +1,32 @@
+import numpy as np
+
+def full_bbox(shape):
+    """Bounding box covering a whole array, as a tuple of slices."""
+    return tuple(slice(0, n) for n in shape)
+
+def foreground_bbox(arr, margin=0):
+    """
+    Bounding box (tuple of slices, array order) of the non-zero voxels of a
+    3D array, grown by margin voxels and clipped to the array.
+    Only one full-volume pass is made: the last axis is resolved inside the
+    already cropped (z, y) extent. An empty array gives the full volume, so
+    callers can always process arr[bbox].
+    """
+    zy = arr.any(axis=2)
+    zs = np.flatnonzero(zy.any(axis=1))
+    if zs.size == 0:
+        return full_bbox(arr.shape)
+    ys = np.flatnonzero(zy.any(axis=0))
+    xs = np.flatnonzero(arr[zs[0]:zs[-1] + 1, ys[0]:ys[-1] + 1].any(axis=(0, 1)))
+
+    return tuple(slice(max(int(idx[0]) - margin, 0), min(int(idx[-1]) + 1 + margin, n))
+                 for idx, n in zip((zs, ys, xs), arr.shape))
+
+def union_bbox(*bboxes):
+    """Smallest bounding box containing all given boxes."""
+    return tuple(slice(min(b[axis].start for b in bboxes), max(b[axis].stop for b in bboxes))
+                 for axis in range(len(bboxes[0])))
+
+def bbox_origin(bbox):
+    """First voxel index of a bounding box."""
+    return np.array([s.start for s in bbox])
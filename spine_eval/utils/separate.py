@@ -0,0 +1,82 @@
+import SimpleITK as sitk
+import os
+import argparse
+
+from spine_eval.utils.components import connected_components_roi, component_stats, relabel
+from spine_eval.utils.prefetch import load_in_background
+from spine_eval.utils.roi import bbox_origin
+from spine_eval.utils.label_io import DEFAULT_LEVEL, write_label_map, add_writer_arguments
+from spine_eval.utils.volume import image_geometry
+from spine_eval.utils.vertebrae import vertebrae_order, load_label_map, load_vertebrae_centers
+# Re-exported for code that imported it from here before it moved to utils.vertebrae
+from spine_eval.utils.vertebrae import load_mask_and_center  # noqa: F401
+
+def main(vertebrae_folder, disc_path, output_path, label_txt_path, multilabel_path=None, label_map=None,
+         level=DEFAULT_LEVEL, threads=None, cropped=False):
+    # Decode the disc mask in the background while the vertebra centers are computed
+    disc_future = load_in_background(sitk.ReadImage, disc_path)
+
+    # Compute vertebra centers, from one multilabel volume if given, else from per-vertebra masks
+    vertebrae_name_to_center = load_vertebrae_centers(vertebrae_folder, multilabel_path, label_map)
+
+    present_vertebrae = set(vertebrae_name_to_center.keys())
+
+    # Build list of valid consecutive vertebrae pairs
+    valid_pairs = []
+    for i in range(len(vertebrae_order) - 1):
+        v1, v2 = vertebrae_order[i], vertebrae_order[i + 1]
+        if v1 in present_vertebrae and v2 in present_vertebrae:
+            c1 = vertebrae_name_to_center[v1]
+            c2 = vertebrae_name_to_center[v2]
+            valid_pairs.append((v1, c1[2], v2, c2[2]))  # z coordinates
+
+    # Load disc mask and compute connected components
+    disc_img = disc_future.result()
+    geometry = image_geometry(disc_img)
+    cc_arr, num_discs, bbox = connected_components_roi(disc_img)
+    del disc_img, disc_future  # only the cropped components are kept from here on
+    stats = component_stats(cc_arr, num_discs, origin=bbox_origin(bbox))
+
+    label_dict = {}
+    new_labels = {}
+    label = 1
+
+    for i in stats.present():
+        center = stats.centroids[i][::-1]  # x, y, z
+        center_z = center[2]
+
+        # Find the correct vertebra pair based on z coordinate and assign label
+        for v1, z1, v2, z2 in valid_pairs:
+            if z1 <= center_z <= z2 or z2 <= center_z <= z1:
+                new_labels[i] = label
+                label_dict[label] = f"{v1.replace('vertebrae_', '')}-{v2.replace('vertebrae_', '')}"
+                label += 1
+                break
+
+    # Save output labeled disc mask, with its label dictionary
+    write_label_map(relabel(cc_arr, new_labels, num_discs), bbox, geometry, output_path, label_dict, label_txt_path,
+                    level, threads, cropped)
+    print(f"Saved labeled discs to: {output_path}")
+    print(f"Saved label map to: {label_txt_path}")
+
+def cli(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Assign labels to intervertebral discs based on vertebra masks.")
+    parser.add_argument("--vertebrae_folder", type=str, default=None, help="Folder containing vertebra masks (.nii.gz)")
+    parser.add_argument("--multilabel_path", type=str, default=None, help="Single multilabel segmentation with all vertebrae (e.g. TotalSegmentator --ml)")
+    parser.add_argument("--label_map", type=str, default=None, help="JSON file mapping vertebra names to values in the multilabel segmentation")
+    parser.add_argument("--disc_path", type=str, required=True, help="Path to the single disc mask (.nii.gz)")
+    parser.add_argument("--output_path", type=str, required=True, help="Output path for the labeled disc mask (.nii.gz)")
+    add_writer_arguments(parser)
+    args = parser.parse_args(argv)
+    if (args.vertebrae_folder is None) == (args.multilabel_path is None):
+        parser.error("Provide exactly one of --vertebrae_folder or --multilabel_path")
+    label_map = load_label_map(args.label_map) if args.label_map else None
+
+    # Generate label text path from output path
+    label_txt_path = os.path.splitext(args.output_path)[0] + "_labels.txt"
+
+    main(args.vertebrae_folder, args.disc_path, args.output_path, label_txt_path, args.multilabel_path, label_map,
+         args.level, args.threads, args.cropped)
+
+if __name__ == "__main__":
+    cli()
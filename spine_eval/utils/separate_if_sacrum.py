@@ -0,0 +1,106 @@
+import SimpleITK as sitk
+import argparse
+import numpy as np
+import os
+
+from spine_eval.utils.components import connected_components_roi, connected_components_coarse, component_stats, filter_components, relabel
+from spine_eval.utils.roi import bbox_origin
+from spine_eval.utils.label_io import DEFAULT_LEVEL, write_label_map, add_writer_arguments
+from spine_eval.utils.volume import image_geometry
+
+# Expected disc label names from bottom to top
+disc_labels = ["L5-Sacrum", "L4-L5", "L3-L4", "L2-L3", "L1-L2", "T12-L1", "T11-T12", "T10-T11", "T9-T10", "T8-T9", "T7-T8", "T6-T7", "T5-T6", "T4-T5", "T3-T4", "T2-T3", "T1-T2"]
+
+# Components smaller than this (mm^3) are speckles, not discs: even the small
+# upper thoracic discs are over 1000 mm^3
+MIN_DISC_VOLUME = 100.0
+
+def separate(disc_path, output_path, label_txt_path, disc_labels=disc_labels, level=DEFAULT_LEVEL, threads=None, cropped=False,
+             min_volume=MIN_DISC_VOLUME, merge_small=False, coarse_factor=1):
+    """
+    Label the discs of a disc mask from bottom to top. Components smaller
+    than min_volume (mm^3) are dropped, or with merge_small merged into the
+    nearest disc, before labels are assigned. With coarse_factor > 1,
+    components are found on the mask downsampled by that factor and refined
+    inside each disc box (see utils.components.connected_components_coarse).
+    """
+    # Load disc mask
+    disc_img = sitk.ReadImage(disc_path)
+
+    # Connected component labeling
+    geometry = image_geometry(disc_img)
+    if coarse_factor > 1:
+        # Speckles that are dropped anyway are only counted, not kept or measured
+        min_voxels = 0 if merge_small else min_volume / np.prod(disc_img.GetSpacing())
+        cc_arr, num_components, bbox, stats, skipped = connected_components_coarse(disc_img, coarse_factor, min_voxels=min_voxels)
+    else:
+        skipped = 0
+        cc_arr, num_components, bbox = connected_components_roi(disc_img)
+        # Statistics of every component in one pass
+        stats = component_stats(cc_arr, num_components, origin=bbox_origin(bbox))
+    del disc_img  # only the cropped components are kept from here on
+
+    # Size filtering before any label is assigned
+    kept, small = filter_components(stats, geometry[2], min_volume, merge_small)
+    # With no disc to merge into, speckles are dropped even with merge_small;
+    # speckles skipped by the coarse pass are dropped too
+    merged = sum(k in kept for k in small)
+    dropped = len(small) - merged + skipped
+    if merged:
+        print(f"Merged {merged} components smaller than {min_volume:g} mm^3.")
+    if dropped:
+        print(f"Dropped {dropped} components smaller than {min_volume:g} mm^3.")
+
+    num_discs = len(set(kept.values()))
+    if num_discs != len(disc_labels):
+        print(f"Found {num_discs} discs.")
+
+    # Compute center Z for each disc
+    disc_centers = []
+    for i in stats.present():
+        if kept.get(i) != i:
+            continue
+        center = stats.centroids[i][::-1]  # x, y, z
+        disc_centers.append((i, center[2]))  # label index, z
+
+    # Sort discs from bottom (highest z) to top (lowest z)
+    disc_centers.sort(key=lambda z: z[1])
+
+    # Assign new labels in anatomical order
+    new_labels = {}
+    label_dict = {}
+
+    for new_label, (old_label, _) in enumerate(disc_centers, start=1):
+        new_labels[old_label] = new_label
+        if new_label <= len(disc_labels):
+            label_dict[new_label] = disc_labels[new_label - 1]
+        else:
+            label_dict[new_label] = f"Unknown_{new_label}"
+
+    # Merged speckles take the label of their disc
+    for old_label, disc in kept.items():
+        new_labels[old_label] = new_labels[disc]
+
+    # Save output mask and label dictionary
+    write_label_map(relabel(cc_arr, new_labels, num_components, np.min_scalar_type(len(disc_centers))), bbox, geometry, output_path, label_dict, label_txt_path,
+                    level, threads, cropped)
+    print(f"Saved labeled discs to: {output_path}")
+    print(f"Saved label map to: {label_txt_path}")
+
+def cli(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Label intervertebral discs from bottom to top assuming full lumbar column.")
+    parser.add_argument("--disc_path", type=str, required=True, help="Path to the disc mask (single .nii.gz)")
+    parser.add_argument("--output_path", type=str, required=True, help="Output path for the labeled disc mask")
+    parser.add_argument("--min_volume", type=float, default=MIN_DISC_VOLUME, help="Smallest disc volume (mm^3); smaller components are speckles")
+    parser.add_argument("--merge_small", action="store_true", help="Merge speckles into the nearest disc instead of dropping them")
+    parser.add_argument("--coarse_factor", type=int, default=1, help="Find components on the mask downsampled by this factor, then refine inside each disc box")
+    add_writer_arguments(parser)
+    args = parser.parse_args(argv)
+
+    label_txt_path = os.path.splitext(args.output_path)[0] + "_labels.txt"
+
+    separate(args.disc_path, args.output_path, label_txt_path, level=args.level, threads=args.threads, cropped=args.cropped,
+             min_volume=args.min_volume, merge_small=args.merge_small, coarse_factor=args.coarse_factor)
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,88 @@
+import os
+import sys
+
+# Thread pool sizes read at startup by OpenMP, the BLAS libraries behind NumPy,
+# numexpr, ITK (SimpleITK) and PyTorch (TotalSegmentator)
+THREAD_ENV_VARS = [
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "ITK_GLOBAL_DEFAULT_NUMBER_OF_THREADS",
+]
+
+# Total core budget used when no --threads option is given
+BUDGET_ENV = "SPINE_EVAL_THREADS"
+
+# Threads per worker set by set_thread_budget in this process (None: library defaults)
+_threads = None
+
+def available_cores():
+    """Cores this process may run on (respects CPU affinity, e.g. in containers or under taskset)."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def core_budget(threads=None):
+    """
+    Total number of cores to use: threads if given, else $SPINE_EVAL_THREADS.
+    Returns None when neither is set (no policy, libraries use their defaults).
+    """
+    if threads is None:
+        threads = os.environ.get(BUDGET_ENV) or None
+    return max(1, int(threads)) if threads is not None else None
+
+def split_budget(total, workers):
+    """Threads per worker when `workers` jobs share `total` cores (at least one each)."""
+    return max(1, total // max(1, workers))
+
+def per_worker_threads(threads, workers):
+    """
+    Threads per job when `workers` jobs run concurrently within the core budget
+    (see core_budget). Without a budget, several workers split the available
+    cores and a single worker keeps the library defaults (None).
+    """
+    budget = core_budget(threads)
+    if budget is None and workers > 1:
+        budget = available_cores()
+    return split_budget(budget, workers) if budget is not None else None
+
+def set_thread_budget(threads):
+    """
+    Limit this process, and the processes it starts from now on, to `threads`
+    threads per library pool. The environment variables take effect for
+    libraries loaded afterwards and for child processes, SimpleITK's global
+    default applies to every filter created afterwards, and BLAS pools that are
+    already loaded are resized through threadpoolctl when it is installed.
+    """
+    global _threads
+    threads = max(1, int(threads))
+    os.environ.update({name: str(threads) for name in THREAD_ENV_VARS})
+
+    # Only adjust libraries that are already imported, so this stays cheap
+    sitk = sys.modules.get("SimpleITK")
+    if sitk is not None:
+        sitk.ProcessObject.SetGlobalDefaultNumberOfThreads(threads)
+    if "numpy" in sys.modules:
+        try:
+            from threadpoolctl import threadpool_limits
+            threadpool_limits(threads)
+        except ImportError:
+            pass
+    _threads = threads
+    return threads
+
+def thread_settings():
+    """Thread counts in effect in this process, as recorded in stage traces."""
+    settings = {"threads": _threads}
+    sitk = sys.modules.get("SimpleITK")
+    if sitk is not None:
+        settings["sitk_threads"] = sitk.ProcessObject.GetGlobalDefaultNumberOfThreads()
+    return settings
+
+def add_thread_arguments(parser):
+    """Add the --threads option shared by the pipeline runners."""
+    parser.add_argument("--threads", type=int, default=None,
+                        help=f"Total cores shared by all concurrent jobs (default: ${BUDGET_ENV}, else library defaults / all cores)")
+    return parser
@@ -0,0 +1,113 @@
+import json
+import os
+import SimpleITK as sitk
+import numpy as np
+
+from spine_eval.utils.components import component_stats
+from spine_eval.utils.prefetch import prefetch
+
+# Expected vertebrae anatomical order
+vertebrae_order = [
+    "vertebrae_T12", "vertebrae_L1", "vertebrae_L2",
+    "vertebrae_L3", "vertebrae_L4", "vertebrae_L5", "sacrum"
+]
+
+# Centers computed from per-vertebra masks are cached in this file next to the masks
+CENTERS_CACHE_NAME = "vertebrae_centers.json"
+
+def load_mask_and_center(path):
+    """Load binary mask and compute the center of the foreground voxels."""
+    img = sitk.ReadImage(path)
+    arr = sitk.GetArrayViewFromImage(img)
+    coords = np.argwhere(arr > 0)
+    if coords.size == 0:
+        raise ValueError(f"No foreground in mask: {path}")
+    center_voxel = np.mean(coords, axis=0)
+    return img, center_voxel[::-1]  # from z,y,x to x,y,z
+
+def load_label_map(path):
+    """Read a JSON name -> label value mapping."""
+    with open(path) as f:
+        return {name: int(value) for name, value in json.load(f).items()}
+
+def centers_from_multilabel(multilabel_path, name_to_value, names=vertebrae_order):
+    """
+    Compute the center (x, y, z) of every named structure of a multilabel
+    segmentation (e.g. TotalSegmentator --ml output) in a single pass.
+    Names missing from the mapping or from the volume are skipped.
+    """
+    img = sitk.ReadImage(multilabel_path)
+    stats = component_stats(sitk.GetArrayViewFromImage(img))  # view: no second full-size copy
+
+    centers = {}
+    for name in names:
+        value = name_to_value.get(name)
+        if value is None or value > stats.num_components or stats.counts[value] == 0:
+            print(f"Skipping missing vertebra: {name}")
+            continue
+        centers[name] = stats.centroids[value][::-1]  # from z,y,x to x,y,z
+    return centers
+
+def _file_signature(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+def centers_from_folder(vertebrae_folder, names=vertebrae_order, workers=None, use_cache=True, max_bytes=None):
+    """
+    Compute the center (x, y, z) of every <name>.nii.gz mask in vertebrae_folder.
+    Masks are loaded concurrently (within max_bytes of decoded volumes, if
+    given) and the centers are cached in the folder, keyed on each file's
+    size and modification time.
+    """
+    cache_path = os.path.join(vertebrae_folder, CENTERS_CACHE_NAME)
+    cache = {}
+    if use_cache and os.path.exists(cache_path):
+        try:
+            with open(cache_path) as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            cache = {}
+
+    centers = {}
+    to_load = []
+    for name in names:
+        path = os.path.join(vertebrae_folder, f"{name}.nii.gz")
+        if not os.path.exists(path):
+            print(f"Skipping missing vertebra: {name}")
+            continue
+        entry = cache.get(name)
+        if entry is not None and entry["signature"] == _file_signature(path):
+            centers[name] = np.array(entry["center"])
+        else:
+            to_load.append((name, path))
+
+    if to_load:
+        depth = workers or min(len(to_load), os.cpu_count() or 1)
+        loaded = prefetch([path for _, path in to_load], lambda path: load_mask_and_center(path)[1], depth, max_bytes)
+        for (name, path), (_, center) in zip(to_load, loaded):
+            centers[name] = center
+            cache[name] = {"signature": _file_signature(path), "center": center.tolist()}
+
+        if use_cache:
+            try:
+                with open(cache_path + ".tmp", 'w') as f:
+                    json.dump(cache, f, indent=2)
+                os.replace(cache_path + ".tmp", cache_path)
+            except OSError:
+                print(f"Could not write vertebra center cache: {cache_path}")
+
+    # Keep the anatomical order of names
+    return {name: centers[name] for name in names if name in centers}
+
+def load_vertebrae_centers(vertebrae_folder=None, multilabel_path=None, label_map=None, names=vertebrae_order):
+    """
+    Return a dict vertebra name -> center (x, y, z), from a multilabel
+    segmentation plus name -> value mapping if given, else from per-vertebra masks.
+    """
+    if multilabel_path is not None:
+        if label_map is None:
+            raise ValueError("A label map is required with a multilabel segmentation.")
+        return centers_from_multilabel(multilabel_path, label_map, names)
+    if vertebrae_folder is None:
+        raise ValueError("Either a vertebrae folder or a multilabel segmentation is required.")
+    return centers_from_folder(vertebrae_folder, names)
@@ -0,0 +1,162 @@
+import gzip
+
+import nibabel as nib
+import numpy as np
+
+# Default size of one slab in low-memory mode
+DEFAULT_SLAB_BYTES = 64 << 20
+
+# NIfTI description of a cropped label map (see utils.label_io): voxel offset
+# (x, y, z) of the stored extent and size of the full grid
+CROP_NOTE = "cropped {} {} {} of {} {} {}"
+
+def as_label_array(data):
+    """
+    Return label data as a non-negative integer array without widening it.
+    Float volumes holding integral values are cast to the smallest fitting dtype.
+    """
+    data = np.asarray(data)
+    if np.issubdtype(data.dtype, np.bool_):
+        return data.view(np.uint8)
+    if np.issubdtype(data.dtype, np.floating):
+        if not np.all(np.equal(np.mod(data, 1), 0)):
+            raise ValueError("Label volume contains non-integer values.")
+        data = data.astype(np.min_scalar_type(int(data.max(initial=0))))
+    if data.size and data.min() < 0:
+        raise ValueError("Label volume contains negative values.")
+    return data
+
+def as_mask_array(data):
+    """
+    Return GT mask data with every voxel > 0 as foreground. Unsigned integer
+    and boolean data is returned as is (non-zero is foreground); float data,
+    e.g. resampled masks with values between 0 and 1, and signed data are
+    thresholded into a uint8 0 / 1 array.
+    """
+    data = np.asarray(data)
+    if np.issubdtype(data.dtype, np.bool_):
+        return data.view(np.uint8)
+    if np.issubdtype(data.dtype, np.unsignedinteger):
+        return data
+    return (data > 0).view(np.uint8)
+
+def crop_extent(descrip):
+    """(offset, full shape) recorded by a CROP_NOTE description, or None."""
+    descrip = np.asarray(descrip).item()
+    if isinstance(descrip, bytes):
+        descrip = descrip.decode("ascii", "replace")
+    fields = str(descrip).split()
+    if len(fields) != 8 or fields[0] != "cropped" or fields[4] != "of":
+        return None
+    return tuple(int(v) for v in fields[1:4]), tuple(int(v) for v in fields[5:8])
+
+def grid_affine(img):
+    """Affine of the full grid of a nibabel image (for cropped label maps, the grid before cropping)."""
+    extent = crop_extent(img.header.get("descrip", b""))
+    if extent is None:
+        return img.affine
+    # The stored extent starts at offset voxels of the full grid
+    shift = np.eye(4)
+    shift[:3, 3] = [-o for o in extent[0]]
+    return img.affine @ shift
+
+def load_label_volume(path, mmap=True, like=None, binary=False):
+    """
+    Load a label volume in its stored integer dtype (no float64 copy), or
+    with binary a GT mask (see as_mask_array).
+    Uncompressed .nii files are memory-mapped, so only the pages that are
+    actually touched are read. Cropped label maps are expanded to their full grid.
+    like: reference affine; the voxel axes are flipped and permuted (views,
+    no copy) to the orientation of that affine.
+    """
+    img = nib.load(path, mmap=mmap)
+    data = (as_mask_array if binary else as_label_array)(np.asanyarray(img.dataobj))
+    extent = crop_extent(img.header.get("descrip", b""))
+    if extent is not None:
+        # Cropped label map: place the stored extent back on the full grid
+        (x, y, z), shape = extent
+        full = np.zeros(shape, dtype=data.dtype)
+        full[x:x + data.shape[0], y:y + data.shape[1], z:z + data.shape[2]] = data
+        data = full
+    if like is not None:
+        ornt = nib.orientations.ornt_transform(nib.io_orientation(img.affine), nib.io_orientation(like))
+        data = nib.orientations.apply_orientation(data, ornt)
+    return data
+
+def volume_info(path):
+    """Shape (of the full grid, for cropped label maps) and stored dtype of a NIfTI volume, from its header only."""
+    header = nib.load(path).header
+    extent = crop_extent(header.get("descrip", b""))
+    shape = extent[1] if extent is not None else header.get_data_shape()
+    return shape, header.get_data_dtype()
+
+def _is_scaled(proxy):
+    return proxy.slope != 1 or proxy.inter != 0
+
+def slab_depth(shape, itemsize, slab_bytes=DEFAULT_SLAB_BYTES):
+    """Number of z slices (last NIfTI axis) that fit in slab_bytes, at least one."""
+    slice_bytes = int(np.prod(shape[:-1])) * itemsize
+    return max(1, slab_bytes // max(slice_bytes, 1))
+
+def iter_slabs(path, slab_bytes=DEFAULT_SLAB_BYTES, depth=None, binary=False):
+    """
+    Yield (z_start, z_stop, slab) over a 3D label volume along z (last NIfTI
+    axis), each slab a label array of shape (x, y, z_stop - z_start).
+
+    NIfTI data is Fortran-ordered, so a z slab is one contiguous run of bytes:
+    uncompressed files are memory-mapped and sliced, gzip files are
+    decompressed sequentially, so only one slab is held in memory at a time.
+    depth overrides the number of slices per slab, so several volumes of the
+    same shape can be walked in lockstep. With binary, slabs are GT masks
+    (see as_mask_array).
+    """
+    convert = as_mask_array if binary else as_label_array
+    img = nib.load(path)
+    proxy = img.dataobj
+    shape = img.shape
+    if crop_extent(img.header.get("descrip", b"")) is not None:
+        raise ValueError(f"Cropped label maps cannot be streamed in slabs: {path}")
+    if len(shape) != 3:
+        raise ValueError(f"Expected a 3D volume, got shape {shape}: {path}")
+    if depth is None:
+        depth = slab_depth(shape, proxy.dtype.itemsize, slab_bytes)
+
+    if not path.endswith(".gz"):
+        # Slicing the proxy reads (or maps) only the bytes of each slab
+        for z in range(0, shape[2], depth):
+            yield z, min(z + depth, shape[2]), convert(proxy[..., z:z + depth])
+        return
+
+    slice_voxels = shape[0] * shape[1]
+    with gzip.open(path, 'rb') as f:
+        f.seek(proxy.offset)
+        for z in range(0, shape[2], depth):
+            n = min(depth, shape[2] - z)
+            slab = np.empty(slice_voxels * n, dtype=proxy.dtype)
+            if f.readinto(memoryview(slab).cast('B')) != slab.nbytes:
+                raise ValueError(f"Truncated volume data: {path}")
+            slab = slab.reshape((shape[0], shape[1], n), order='F')
+            if _is_scaled(proxy):
+                slab = slab * proxy.slope + proxy.inter
+            yield z, z + n, convert(slab)
+
+def image_geometry(img):
+    """Size (x, y, z), origin, spacing and direction of a SimpleITK image, without its pixels."""
+    return img.GetSize(), img.GetOrigin(), img.GetSpacing(), img.GetDirection()
+
+def image_from_roi(sub_arr, bbox, geometry):
+    """
+    SimpleITK image with the given geometry (see image_geometry) holding
+    sub_arr at bbox (array order) and 0 elsewhere. The cropped array is padded
+    directly, so the output image is the only full-size buffer allocated.
+    """
+    # Only the writers need SimpleITK: the Dice tools import this module without it
+    import SimpleITK as sitk
+    size, origin, spacing, direction = geometry
+    lower = [s.start for s in bbox[::-1]]
+    upper = [n - s.stop for s, n in zip(bbox[::-1], size)]
+    img = sitk.ConstantPad(sitk.GetImageFromArray(sub_arr), lower, upper, 0)
+    img.SetOrigin(origin)
+    img.SetSpacing(spacing)
+    img.SetDirection(direction)
+    return img
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+import SimpleITK as sitk
+
+from benchmarks.phantom import make_spine_phantom
+from spine_eval.utils.components import connected_components_coarse, connected_components_roi, component_stats
+from spine_eval.utils.roi import bbox_origin
+
+def _phantom_mask(shape=(64, 64, 48), n_noise=12):
+    # SimpleITK takes arrays in (z, y, x) order
+    labels = make_spine_phantom(shape, n_discs=4, n_noise=n_noise, seed=1)
+    return sitk.GetImageFromArray((labels > 0).astype(np.uint8).transpose())
+
+def _same_partition(a, b):
+    # Same foreground and a one-to-one match between the labels of a and b
+    fg = a != 0
+    assert np.array_equal(fg, b != 0)
+    pairs = np.unique(np.stack([a[fg], b[fg]]), axis=1)
+    assert pairs.shape[1] == len(np.unique(a[fg])) == len(np.unique(b[fg]))
+
+@pytest.mark.parametrize("factor", [2, 3, 4])
+def test_coarse_matches_full_resolution(factor):
+    img = _phantom_mask()
+    cc_arr, num, bbox = connected_components_roi(img)
+    coarse_arr, coarse_num, coarse_bbox, stats, skipped = connected_components_coarse(img, factor)
+    assert coarse_bbox == bbox
+    assert coarse_num == num and skipped == 0
+    _same_partition(cc_arr, coarse_arr)
+
+    full_stats = component_stats(cc_arr, num, origin=bbox_origin(bbox))
+    order = lambda s: np.lexsort(s.centroids[1:].T)
+    assert np.array_equal(np.sort(stats.counts[1:]), np.sort(full_stats.counts[1:]))
+    assert np.allclose(stats.centroids[1:][order(stats)], full_stats.centroids[1:][order(full_stats)])
+
+def test_coarse_splits_components_touching_only_at_coarse_level():
+    arr = np.zeros((8, 8, 8), dtype=np.uint8)
+    # One coarse block, two voxels that do not touch at full resolution
+    arr[2, 2, 2] = 1
+    arr[2, 3, 4] = 1
+    coarse_arr, num, _, stats, _ = connected_components_coarse(sitk.GetImageFromArray(arr), 4)
+    assert num == 2
+    assert list(stats.counts[1:]) == [1, 1]
+
+def test_coarse_counts_skipped_speckles():
+    img = _phantom_mask()
+    cc_arr, num, bbox = connected_components_roi(img)
+    counts = component_stats(cc_arr, num).counts[1:]
+    min_voxels = 100
+    _, coarse_num, _, stats, skipped = connected_components_coarse(img, 2, min_voxels=min_voxels)
+    # Speckles are either skipped at the coarse level or kept and filtered afterwards
+    assert coarse_num + skipped == num
+    assert np.count_nonzero(stats.counts[1:] >= min_voxels) == np.count_nonzero(counts >= min_voxels)
+    assert skipped > 0
@@ -0,0 +1,37 @@
+import csv
+import json
+
+import nibabel as nib
+import numpy as np
+import pytest
+
+from benchmarks.phantom import write_phantom
+from spine_eval.dice_score.engine import compute_dice_per_label
+
+@pytest.fixture(scope="module")
+def case(tmp_path_factory):
+    out_dir = tmp_path_factory.mktemp("phantom")
+    paths = write_phantom(str(out_dir), shape=(48, 40, 64), n_discs=4)
+    # Imperfect prediction: discs shifted by one slice, one disc labelled as its neighbour
+    labeled = nib.load(paths["labeled"])
+    pred = np.roll(np.asanyarray(labeled.dataobj), 1, axis=2)
+    pred[pred == 4] = 3
+    paths["prediction"] = str(out_dir / "prediction.nii.gz")
+    nib.save(nib.Nifti1Image(pred, labeled.affine), paths["prediction"])
+    with open(paths["label_mapping"]) as f:
+        paths["mapping"] = json.load(f)
+    return paths
+
+def _scores(case, tmp_path, **kwargs):
+    output_csv = tmp_path / "dice.csv"
+    compute_dice_per_label(case["gt_folder"], case["prediction"], case["mapping"], str(output_csv), **kwargs)
+    with open(output_csv) as f:
+        return [row for row in csv.reader(f)]
+
+def test_slab_matches_in_memory(case, tmp_path):
+    in_memory = _scores(case, tmp_path)
+    # A few slices per slab, so the files are walked in many steps
+    slabs = _scores(case, tmp_path, low_memory=True, slab_bytes=48 * 40 * 5)
+    assert slabs == in_memory
+    assert in_memory[-1][0] == "Average Dice"
+    assert 0 < float(in_memory[-1][2]) < 1
@@ -0,0 +1,52 @@
+import nibabel as nib
+import numpy as np
+import pytest
+import SimpleITK as sitk
+
+from benchmarks.phantom import make_spine_phantom
+from spine_eval.utils.label_io import read_label_map, write_label_map
+from spine_eval.utils.roi import foreground_bbox
+from spine_eval.utils.volume import image_from_roi, image_geometry, load_label_volume
+
+@pytest.fixture
+def labeled_image():
+    labels = make_spine_phantom((40, 36, 48), n_discs=3, n_noise=0).transpose()
+    img = sitk.GetImageFromArray(labels)
+    img.SetSpacing((0.8, 0.9, 1.5))
+    img.SetOrigin((-12.0, 30.5, 7.25))
+    # Oblique direction, so any axis or sign mix-up shows in the geometry
+    c, s = np.cos(0.3), np.sin(0.3)
+    img.SetDirection((c, -s, 0.0, s, c, 0.0, 0.0, 0.0, 1.0))
+    return img
+
+def _assert_same_image(a, b):
+    assert np.array_equal(sitk.GetArrayViewFromImage(a), sitk.GetArrayViewFromImage(b))
+    assert a.GetSize() == b.GetSize()
+    assert np.allclose(a.GetOrigin(), b.GetOrigin())
+    assert np.allclose(a.GetSpacing(), b.GetSpacing())
+    assert np.allclose(a.GetDirection(), b.GetDirection())
+
+def test_streamed_nifti_matches_simpleitk(labeled_image, tmp_path):
+    arr = sitk.GetArrayFromImage(labeled_image)
+    bbox = foreground_bbox(arr)
+    geometry = image_geometry(labeled_image)
+    streamed, reference = str(tmp_path / "streamed.nii.gz"), str(tmp_path / "reference.nii.gz")
+    labels_txt = str(tmp_path / "labels.txt")
+    write_label_map(arr[bbox], bbox, geometry, streamed, {1: "a", 2: "b"}, labels_txt)
+    sitk.WriteImage(image_from_roi(arr[bbox], bbox, geometry), reference)
+
+    _assert_same_image(sitk.ReadImage(streamed), sitk.ReadImage(reference))
+    assert np.allclose(nib.load(streamed).affine, nib.load(reference).affine)
+    with open(labels_txt) as f:
+        assert f.read() == "1: a\n2: b\n"
+
+def test_cropped_label_map_expands_to_full_grid(labeled_image, tmp_path):
+    arr = sitk.GetArrayFromImage(labeled_image)
+    bbox = foreground_bbox(arr)
+    cropped, reference = str(tmp_path / "cropped.nii.gz"), str(tmp_path / "reference.nii.gz")
+    write_label_map(arr[bbox], bbox, image_geometry(labeled_image), cropped, cropped=True)
+    sitk.WriteImage(labeled_image, reference)
+
+    assert nib.load(cropped).shape != nib.load(reference).shape
+    _assert_same_image(read_label_map(cropped), sitk.ReadImage(reference))
+    assert np.array_equal(load_label_volume(cropped), load_label_volume(reference))